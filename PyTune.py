@@ -1,23 +1,1446 @@
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import sys
 import os
+
+if __name__ == '__main__':
+    # Если плеер уже запущен, передаём ему файлы и команды и сразу выходим,
+    # не загружая интерфейс и мультимедиа
+    import instance
+    _LAUNCH = instance.parse_args(sys.argv[1:])
+    if not _LAUNCH['new_instance'] and instance.forward(_LAUNCH):
+        sys.exit(0)
+
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QPushButton, QSlider, QLabel,
-    QFileDialog, QHBoxLayout, QVBoxLayout, QListWidget, QMessageBox, QLineEdit,
-    QTabWidget, QTextEdit
+    QApplication, QWidget, QPushButton, QSlider, QAbstractSlider, QLabel,
+    QFileDialog, QHBoxLayout, QVBoxLayout, QTableView, QAbstractItemView, QHeaderView,
+    QMessageBox, QLineEdit, QTabWidget, QTextEdit, QPlainTextEdit, QProgressDialog, QSpinBox
 )
-from PyQt6.QtCore import Qt, QUrl, QTimer
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, APIC, TIT2, TPE1, USLT, TXXX
-from mutagen.flac import FLAC
-from mutagen.mp4 import MP4
-from mutagen.asf import ASF
-from mutagen.oggvorbis import OggVorbis
-from mutagen.oggopus import OggOpus
-from mutagen.wave import WAVE
-import json
-import random
+from PyQt6.QtCore import (
+    Qt, QUrl, QTimer, QEvent, QObject, QRunnable, QThread, QThreadPool, QStandardPaths, pyqtSignal,
+    QFileSystemWatcher,
+    QAbstractTableModel, QAbstractProxyModel, QModelIndex, QItemSelection, QItemSelectionModel,
+    QBuffer, QIODevice, QMimeData, QLine
+)
+from PyQt6.QtGui import (
+    QPixmap, QImage, QAction, QKeySequence, QPalette, QPainter, QTextCharFormat, QTextCursor,
+    QTextFormat, QFontDatabase
+)
+from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput, QAudioDecoder, QAudioFormat
+import bisect
+import itertools
+from array import array
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from library import LibraryStore, PlaylistJournal, AUDIO_EXTENSIONS, list_folder, scan_audio_files
+from tags import read_tags
+from search import SearchIndex
+from shuffle import ShuffleQueue
+from tracks import TrackStore
+from cache import LRUCache, ThumbnailCache
+from lyrics import parse_lrc, is_synced, read_sidecar, choose_lyrics
+from tracing import Tracer
+import waveform
+
+
+# Ограничения кэшей в памяти
+TRACK_CACHE_ENTRIES = 2000
+TRACK_CACHE_BYTES = 16 * 1024 * 1024
+COVER_CACHE_ENTRIES = 500
+COVER_CACHE_BYTES = 64 * 1024 * 1024
+COVER_SIZE = 200
+THUMBNAIL_CACHE_BYTES = 128 * 1024 * 1024
+WAVEFORM_CACHE_BYTES = 32 * 1024 * 1024
+WAVEFORM_PROCESSES = 2
+
+# PYTUNE_PROFILE_STARTUP=1 печатает, сколько заняли этапы запуска
+PROFILE_STARTUP = bool(os.environ.get('PYTUNE_PROFILE_STARTUP'))
+# PYTUNE_TRACE=1 включает замеры горячих путей и вкладку «Отладка» (её также открывает Ctrl+Shift+D)
+tracer = Tracer(enabled=bool(os.environ.get('PYTUNE_TRACE')))
+TRACK_SWITCH = 'track switch'
+
+# Сколько раз в секунду обновляются позиция, время и текст песни при воспроизведении
+DEFAULT_REFRESH_RATE = 10
+MAX_REFRESH_RATE = 120
+
+
+def parse_refresh_rate(value):
+    """Частота из PYTUNE_REFRESH_RATE: неверное или неположительное значение заменяется на DEFAULT_REFRESH_RATE."""
+    if not value:
+        return DEFAULT_REFRESH_RATE
+    try:
+        rate = float(value)
+    except ValueError:
+        rate = None
+    # «not rate > 0» отсекает и nan
+    if rate is None or not rate > 0:
+        print(f"PYTUNE_REFRESH_RATE={value!r}: нужна положительная частота, используется {DEFAULT_REFRESH_RATE}")
+        return DEFAULT_REFRESH_RATE
+    return min(rate, MAX_REFRESH_RATE)
+
+
+REFRESH_RATE = parse_refresh_rate(os.environ.get('PYTUNE_REFRESH_RATE'))
+
+
+def startup_mark(stage):
+    if PROFILE_STARTUP:
+        elapsed = (time.perf_counter() - _STARTUP_T0) * 1000
+        print(f"[startup] {stage}: {elapsed:.1f} мс", file=sys.stderr)
+
+
+def make_thumbnail(cover_data):
+    """Уменьшает обложку до размера показа и кодирует в JPEG; None, если картинка битая."""
+    image = QImage()
+    if not image.loadFromData(cover_data):
+        return None
+    image = image.scaled(COVER_SIZE, COVER_SIZE,
+                         Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, 'JPG', 90)
+    return bytes(buffer.data())
+
+
+class _MetadataTask(QRunnable):
+    def __init__(self, ticket, file_path, done, thumbnails, with_cover=True, known=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.ticket = ticket
+        self.file_path = file_path
+        self.with_cover = with_cover
+        self.known = known
+        self.cancelled = False
+        self.info = self.stat = self.sidecar = None
+        self._done = done
+        self._thumbnails = thumbnails
+
+    def run(self):
+        if not self.cancelled:
+            try:
+                # stat до разбора: запись в кэше должна соответствовать прочитанной версии
+                self.stat = os.stat(self.file_path)
+            except OSError:
+                pass
+        if self.stat is not None and self.known != (self.stat.st_size, self.stat.st_mtime):
+            with tracer.span('read_tags', path=self.file_path):
+                info = read_tags(self.file_path, self.with_cover)
+            self.info = self._with_thumbnail(info)
+        # Полный разбор нужен для показа трека: заодно читается и .lrc рядом
+        if self.stat is not None and self.with_cover and not (
+                self.info is not None and is_synced(self.info.lyrics)):
+            self.sidecar = read_sidecar(self.file_path)
+        self._done.emit(self.ticket)
+
+    def _with_thumbnail(self, info):
+        # Полноразмерная обложка дальше потока не уходит: GUI получает миниатюру
+        if not info.cover_hash or self._thumbnails is None:
+            return info
+        with tracer.span('thumbnail cache'):
+            thumbnail = self._thumbnails.get(info.cover_hash)
+        if thumbnail is None:
+            with tracer.span('make_thumbnail'):
+                thumbnail = make_thumbnail(info.cover)
+            if thumbnail is None:
+                return info
+            self._thumbnails.put(info.cover_hash, thumbnail)
+        info.cover = thumbnail
+        return info
+
+
+class _MissingFilesTask(QRunnable):
+    def __init__(self, ticket, paths, done):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.ticket = ticket
+        self.paths = paths
+        self.cancelled = False
+        self._done = done
+
+    def run(self):
+        missing = []
+        for path in self.paths:
+            if self.cancelled:
+                return
+            if not os.path.isfile(path):
+                missing.append(path)
+        self._done.emit(self.ticket, missing)
+
+
+class MetadataService(QObject):
+    """
+    Разбирает теги в пуле потоков, чтобы не блокировать GUI.
+    Результат приходит сигналом loaded(ticket, file_path, info, stat), где info —
+    tags.TrackInfo; если задан кэш миниатюр, вместо обложки в info лежит её миниатюра.
+    Полный разбор (with_cover=True) кладёт в info.sidecar текст из файла .lrc.
+
+    Если в заявке указана версия уже показанных данных и файл с тех пор не менялся,
+    теги не читаются: полный разбор приходит сигналом unchanged(ticket, file_path,
+    sidecar), а для строк плейлиста ничего не приходит. Пропавший файл приходит
+    сигналом missing(ticket, file_path).
+    """
+    loaded = pyqtSignal(int, str, object, object)
+    unchanged = pyqtSignal(int, str, object)
+    missing = pyqtSignal(int, str)
+    missing_files = pyqtSignal(list)
+    _finished = pyqtSignal(int)
+    _missing_found = pyqtSignal(int, list)
+
+    def __init__(self, parent=None, thumbnails=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(2, min(4, QThread.idealThreadCount())))
+        self._tasks = {}
+        self._last_ticket = 0
+        self._finished.connect(self._on_finished)
+        self._missing_found.connect(self._on_missing_found)
+
+    def request(self, file_path, priority=0, with_cover=True, known=None):
+        """
+        Ставит файл в очередь разбора и возвращает номер заявки.
+        Для строк плейлиста хватает with_cover=False: обложка не читается.
+        known — версия (размер, время изменения) данных, которые уже показаны.
+        """
+        self._last_ticket += 1
+        task = _MetadataTask(self._last_ticket, file_path, self._finished, self.thumbnails,
+                             with_cover, known)
+        self._tasks[self._last_ticket] = task
+        self._pool.start(task, priority)
+        return self._last_ticket
+
+    def find_missing(self, paths):
+        """Проверяет в фоне, какие файлы пропали; список приходит сигналом missing_files."""
+        self._last_ticket += 1
+        task = _MissingFilesTask(self._last_ticket, list(paths), self._missing_found)
+        self._tasks[self._last_ticket] = task
+        self._pool.start(task, 1)
+        return self._last_ticket
+
+    def cancel(self, ticket):
+        """Отменяет заявку: ещё не начатый разбор будет пропущен, результат не придёт."""
+        task = self._tasks.get(ticket)
+        if task is not None:
+            task.cancelled = True
+
+    def shutdown(self):
+        for task in self._tasks.values():
+            task.cancelled = True
+        self._pool.waitForDone()
+
+    def _on_finished(self, ticket):
+        task = self._tasks.pop(ticket, None)
+        if task is None or task.cancelled:
+            return
+        if task.stat is None:
+            self.missing.emit(ticket, task.file_path)
+        elif task.info is not None:
+            task.info.sidecar = task.sidecar
+            self.loaded.emit(ticket, task.file_path, task.info, task.stat)
+        elif task.with_cover:
+            self.unchanged.emit(ticket, task.file_path, task.sidecar)
+
+    def _on_missing_found(self, ticket, missing):
+        task = self._tasks.pop(ticket, None)
+        if task is not None and not task.cancelled:
+            self.missing_files.emit(missing)
+
+
+class _JournalFlushTask(QRunnable):
+    def __init__(self, journal):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.journal = journal
+
+    def run(self):
+        self.journal.flush()
+
+
+class _FolderScanTask(QRunnable):
+    BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.25
+
+    def __init__(self, ticket, folders, batch_found, done):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.ticket = ticket
+        self.folders = folders
+        self.cancelled = False
+        self._batch_found = batch_found
+        self._done = done
+
+    def run(self):
+        batch = []
+        last_emit = time.monotonic()
+        files = itertools.chain.from_iterable(scan_audio_files(f) for f in self.folders)
+        for path in files:
+            if self.cancelled:
+                break
+            batch.append(path)
+            # Пачки отдаются и по размеру, и по времени, чтобы на медленном
+            # диске прогресс всё равно двигался
+            now = time.monotonic()
+            if len(batch) >= self.BATCH_SIZE or now - last_emit >= self.BATCH_INTERVAL:
+                self._batch_found.emit(self.ticket, batch)
+                batch = []
+                last_emit = now
+        if batch and not self.cancelled:
+            self._batch_found.emit(self.ticket, batch)
+        self._done.emit(self.ticket)
+
+
+class FolderImporter(QObject):
+    """
+    Обходит каталоги в фоновом потоке. Найденные файлы приходят пачками
+    сигналом batch_found, по окончании обхода приходит finished.
+    """
+    batch_found = pyqtSignal(list)
+    finished = pyqtSignal()
+    _batch = pyqtSignal(int, list)
+    _done = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._task = None
+        self._last_ticket = 0
+        self._batch.connect(self._on_batch)
+        self._done.connect(self._on_done)
+
+    def start(self, folders):
+        self.cancel()
+        self._last_ticket += 1
+        self._task = _FolderScanTask(self._last_ticket, folders, self._batch, self._done)
+        self._pool.start(self._task)
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancelled = True
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.waitForDone()
+
+    def _on_batch(self, ticket, paths):
+        if ticket == self._last_ticket and not self._task.cancelled:
+            self.batch_found.emit(paths)
+
+    def _on_done(self, ticket):
+        if ticket == self._last_ticket:
+            self._task = None
+            self.finished.emit()
+
+
+class _WatchScanTask(QRunnable):
+    def __init__(self, ticket, roots, done):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.ticket = ticket
+        self.roots = roots
+        self.cancelled = False
+        self._done = done
+
+    def run(self):
+        folders = []
+        files = []
+        mount_points = [root for root in self.roots if os.path.ismount(root)]
+        stack = list(self.roots)
+        while stack and not self.cancelled:
+            folder = stack.pop()
+            try:
+                found, subfolders = list_folder(folder)
+            except OSError:
+                continue
+            folders.append(folder)
+            files.extend(found)
+            stack.extend(subfolders)
+        if not self.cancelled:
+            self._done.emit(self.ticket, folders, files, mount_points)
+
+
+def _root_of(roots, folder):
+    for root in roots:
+        if folder == root or folder.startswith(os.path.join(root, '')):
+            return root
+    return None
+
+
+def _root_available(root, was_mount_point):
+    """
+    Доступна ли наблюдаемая папка. Точка монтирования отключённого диска
+    остаётся пустым каталогом, поэтому папка, в которой нет ничего, и папка,
+    переставшая быть точкой монтирования, считаются недоступными.
+    """
+    try:
+        with os.scandir(root) as entries:
+            if next(entries, None) is None:
+                return False
+    except OSError:
+        return False
+    return not was_mount_point or os.path.ismount(root)
+
+
+class _FolderListTask(QRunnable):
+    """
+    Просматривает изменившиеся каталоги для сверки с плейлистом: файлы вместе
+    с версией (размер, время изменения) и подкаталоги, которых нет среди
+    наблюдаемых, — их содержимое просматривается тоже. Каталоги внутри папки,
+    недоступной целиком (например, отключили диск), пропускаются: пропажа
+    всего её содержимого не считается удалением треков.
+    """
+
+    def __init__(self, ticket, folders, roots, watched, mount_points, done):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.ticket = ticket
+        self.folders = folders
+        self.roots = roots
+        self.watched = watched
+        self.mount_points = mount_points
+        self.cancelled = False
+        self._done = done
+
+    def run(self):
+        listing = {}  # каталог -> [(путь, (размер, время изменения))]
+        vanished = []  # каталоги, которые не читаются: их удалили или перенесли
+        new_folders = []
+        watched = set(self.watched)
+        available = {}
+        queue = list(self.folders)
+        seen = set()
+        while queue and not self.cancelled:
+            folder = queue.pop(0)
+            if folder in seen:
+                continue
+            seen.add(folder)
+            root = _root_of(self.roots, folder)
+            if root is None:
+                continue
+            if root not in available:
+                available[root] = _root_available(root, root in self.mount_points)
+            if not available[root]:
+                continue
+            try:
+                files, subfolders = list_folder(folder)
+            except OSError:
+                vanished.append(folder)
+                continue
+            entries = []
+            for path in files:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, (stat.st_size, stat.st_mtime)))
+            listing[folder] = entries
+            # Новый подкаталог (например, скопированный альбом) просматривается целиком,
+            # а переименованный или удалённый сам об этом не сообщает
+            fresh = [f for f in subfolders if f not in watched]
+            watched.update(fresh)
+            new_folders.extend(fresh)
+            queue.extend(fresh)
+            subfolders = set(subfolders)
+            queue.extend(f for f in watched
+                         if os.path.dirname(f) == folder and f not in subfolders)
+        if not self.cancelled:
+            self._done.emit(self.ticket, listing, vanished, new_folders)
+
+
+class LibraryWatcher(QObject):
+    """
+    Следит за импортированными папками и всеми их подкаталогами через
+    QFileSystemWatcher. Уведомления приходят сериями (копирование альбома,
+    запись тегов), поэтому изменившиеся каталоги копятся и уходят одной пачкой
+    на просмотр, когда уведомления стихли на DEBOUNCE_MS; при непрерывном
+    потоке уведомлений пачка уходит не реже раза в MAX_DELAY секунд.
+
+    Подкаталоги ищутся, а изменившиеся каталоги просматриваются в фоновом
+    потоке. Аудиофайлы, найденные первым обходом, приходят сигналом scanned,
+    результат просмотра — сигналом changed(listing, vanished): listing —
+    {каталог: [(путь, (размер, время изменения))]}, vanished — каталоги,
+    которые пропали.
+    """
+    DEBOUNCE_MS = 1000
+    MAX_DELAY = 5.0
+
+    scanned = pyqtSignal(list)
+    changed = pyqtSignal(object, list)
+    _scanned = pyqtSignal(int, list, list, list)
+    _listed = pyqtSignal(int, object, list, list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.roots = []
+        self._folders = set()
+        self._mount_points = frozenset()  # папки, которые при первом обходе были точками монтирования
+        self._followed = None
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._dirty = set()
+        self._dirty_since = 0.0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self._emit_changed)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._task = None
+        self._list_task = None
+        self._last_ticket = 0
+        self._scanned.connect(self._on_scanned)
+        self._listed.connect(self._on_listed)
+
+    def watch(self, roots):
+        """Следит за каталогами roots вместо прежних; пустой список выключает наблюдение."""
+        followed = self._followed
+        self.stop()
+        self.roots = list(roots)
+        if self.roots:
+            self._last_ticket += 1
+            self._task = _WatchScanTask(self._last_ticket, self.roots, self._scanned)
+            self._pool.start(self._task)
+            self.follow(followed)
+
+    def stop(self):
+        for task in (self._task, self._list_task):
+            if task is not None:
+                task.cancelled = True
+        self._task = self._list_task = None
+        self._mount_points = frozenset()
+        self._timer.stop()
+        self._dirty.clear()
+        self.follow(None)
+        if self._folders:
+            self._watcher.removePaths(list(self._folders))
+            self._folders.clear()
+        self.roots = []
+
+    def shutdown(self):
+        self.stop()
+        self._pool.waitForDone()
+
+    def root_of(self, folder):
+        """Наблюдаемая папка, внутри которой лежит folder, или None."""
+        return _root_of(self.roots, folder)
+
+    def recheck(self, folders):
+        """Просматривает каталоги сразу, как если бы в них что-то изменилось."""
+        self._dirty.update(folders)
+        self._timer.stop()
+        self._emit_changed()
+
+    def follow(self, path):
+        """
+        Следит ещё и за самим файлом path (играющим треком). В Linux перезапись
+        файла на месте не меняет каталог, и без этого новые теги и текст
+        играющего трека были бы замечены только при следующем изменении каталога.
+        """
+        if self._followed is not None:
+            self._watcher.removePath(self._followed)
+            self._followed = None
+        if path and self.root_of(os.path.dirname(path)) is not None and self._watcher.addPath(path):
+            self._followed = path
+
+    def add_folders(self, folders):
+        folders = [folder for folder in folders if folder not in self._folders]
+        if not folders:
+            return
+        # Число наблюдаемых каталогов ограничено системой (inotify в Linux)
+        failed = set(self._watcher.addPaths(folders))
+        if failed:
+            print(f"Не удалось следить за каталогами ({len(failed)}), например: {min(failed)}")
+        self._folders.update(folder for folder in folders if folder not in failed)
+
+    def forget(self, folder):
+        """Перестаёт следить за удалённым каталогом и его подкаталогами."""
+        prefix = os.path.join(folder, '')
+        gone = [f for f in self._folders if f == folder or f.startswith(prefix)]
+        if gone:
+            self._watcher.removePaths(gone)
+            self._folders.difference_update(gone)
+
+    def _on_scanned(self, ticket, folders, files, mount_points):
+        if self._task is None or ticket != self._task.ticket:
+            return
+        self._task = None
+        self._mount_points = frozenset(mount_points)
+        self.add_folders(folders)
+        self.scanned.emit(files)
+
+    def _on_file_changed(self, path):
+        # Файл, заменённый новым (так сохраняют многие редакторы), выпадает из наблюдения
+        if path == self._followed and path not in self._watcher.files() and os.path.exists(path):
+            self._watcher.addPath(path)
+        self._on_changed(os.path.dirname(path))
+
+    def _on_changed(self, folder):
+        if not self._dirty:
+            self._dirty_since = time.monotonic()
+        self._dirty.add(folder)
+        if not self._timer.isActive() or time.monotonic() - self._dirty_since < self.MAX_DELAY:
+            self._timer.start()
+
+    def _emit_changed(self):
+        # Пока идёт просмотр, новые изменения копятся до его конца
+        if self._list_task is not None or not self._dirty:
+            return
+        folders, self._dirty = sorted(self._dirty), set()
+        self._last_ticket += 1
+        self._list_task = _FolderListTask(self._last_ticket, folders, list(self.roots),
+                                          frozenset(self._folders), self._mount_points, self._listed)
+        self._pool.start(self._list_task)
+
+    def _on_listed(self, ticket, listing, vanished, new_folders):
+        if self._list_task is None or ticket != self._list_task.ticket:
+            return
+        self._list_task = None
+        for folder in vanished:
+            self.forget(folder)
+        self.add_folders(new_folders)
+        self.changed.emit(listing, vanished)
+        if self._dirty:
+            self._timer.start()
+
+
+class WaveformService(QObject):
+    """
+    Пики волновой формы: считаются один раз на версию файла и лежат на диске,
+    при показе файл только отображается в память. WAV разбирается в пуле
+    процессов, остальные форматы декодирует QAudioDecoder, а пики по его
+    буферам сводятся в NumPy. Результат приходит сигналом ready(path, peaks).
+    """
+    ready = pyqtSignal(str, object)
+    _computed = pyqtSignal(str, str, object)
+
+    def __init__(self, cache, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self._executor = None
+        self._futures = set()
+        self._pending = set()
+        self._decoder = None
+        self._decoding = None  # (path, key, минимумы, максимумы)
+        self._computed.connect(self._on_computed)
+
+    def request(self, path, background=False, version=None):
+        """
+        Запрашивает пики файла. С background=True декодер не отбирается
+        у трека, который уже разбирается (так прогреваются следующие треки).
+        version — (размер, время изменения) из библиотеки; без неё файл проверяется stat.
+        """
+        if not waveform.available():
+            return
+        waveform.load()
+        if version is None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            version = (stat.st_size, stat.st_mtime)
+        key = waveform.peaks_key(path, version)
+        if key in self._pending or self._emit_cached(path, key):
+            return
+        if os.path.splitext(path)[1].lower() == '.wav':
+            self._pending.add(key)
+            if self._executor is None:
+                # spawn: дочерний процесс не наследует потоки и состояние Qt
+                self._executor = ProcessPoolExecutor(
+                    WAVEFORM_PROCESSES, mp_context=waveform.worker_context())
+            try:
+                future = self._executor.submit(waveform.wav_peaks, path)
+            except BrokenProcessPool:
+                # Процесс пула упал: пул создаётся заново, а этот файл разберёт декодер
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                self._decode(path, key)
+                return
+            self._futures.add(future)
+            future.add_done_callback(functools.partial(self._pool_done, path, key))
+        elif not (background and self._decoding is not None):
+            self._pending.add(key)
+            self._decode(path, key)
+
+    def shutdown(self):
+        for future in list(self._futures):
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._decoder is not None:
+            self._decoding = None
+            self._decoder.stop()
+
+    def _emit_cached(self, path, key):
+        file_path = self.cache.locate(key)
+        if file_path is None:
+            return False
+        try:
+            peaks = waveform.load_peaks(file_path)
+        except (OSError, ValueError):
+            return False
+        self.ready.emit(path, peaks)
+        return True
+
+    def _store(self, path, key, data):
+        self._pending.discard(key)
+        if data:
+            self.cache.put(key, data)
+            self._emit_cached(path, key)
+
+    # --- пул процессов ---
+
+    def _pool_done(self, path, key, future):
+        # Вызывается в служебном потоке пула: в GUI результат уходит сигналом
+        self._futures.discard(future)
+        if future.cancelled():
+            return
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"Не удалось построить волновую форму {path}: {e}")
+            data = None
+        self._computed.emit(path, key, data)
+
+    def _on_computed(self, path, key, data):
+        if data is None:
+            # Например, WAV с float-отсчётами: пусть разберёт декодер
+            self._decode(path, key)
+            return
+        self._store(path, key, data)
+
+    # --- декодер ---
+
+    def _decode(self, path, key):
+        if self._decoding is not None:
+            # Важен только текущий трек: прежнее декодирование бросаем
+            self._pending.discard(self._decoding[1])
+            self._decoding = None
+            self._decoder.stop()
+        if self._decoder is None:
+            self._decoder = QAudioDecoder(self)
+            audio_format = QAudioFormat()
+            audio_format.setSampleFormat(QAudioFormat.SampleFormat.Int16)
+            audio_format.setChannelCount(1)
+            audio_format.setSampleRate(8000)
+            self._decoder.setAudioFormat(audio_format)
+            self._decoder.bufferReady.connect(self._decoder_buffer)
+            self._decoder.finished.connect(self._decoder_finished)
+            self._decoder.error.connect(self._decoder_error)
+        self._decoding = (path, key, [], [])
+        self._decoder.setSource(QUrl.fromLocalFile(path))
+        self._decoder.start()
+
+    def _decoder_buffer(self):
+        buffer = self._decoder.read()
+        if self._decoding is None or not buffer.isValid():
+            return
+        data = buffer.constData().asstring(buffer.byteCount())
+        sample_format = buffer.format().sampleFormat()
+        if sample_format == QAudioFormat.SampleFormat.Float:
+            samples = waveform.float_to_int16(data)
+        else:
+            samples = waveform.to_int16(data, buffer.format().bytesPerSample())
+        mins, maxs = waveform.block_peaks(samples, waveform.BLOCK_SAMPLES)
+        self._decoding[2].append(mins)
+        self._decoding[3].append(maxs)
+
+    def _decoder_finished(self):
+        if self._decoding is None:
+            return
+        path, key, mins, maxs = self._decoding
+        self._decoding = None
+        data = b''
+        if mins:
+            data = waveform.finish_peaks(waveform.np.concatenate(mins), waveform.np.concatenate(maxs))
+        self._store(path, key, data)
+
+    def _decoder_error(self, error):
+        if self._decoding is None:
+            return
+        path, key = self._decoding[:2]
+        self._decoding = None
+        self._pending.discard(key)
+        print(f"Не удалось декодировать {path} для волновой формы: {self._decoder.errorString()}")
+
+
+class RefreshScheduler(QObject):
+    """
+    Сводит обновления вида в кадры не чаще rate раз в секунду: сколько бы
+    раз обновление ни запросили, за кадр оно выполняется один раз. Кадры идут
+    только по запросу, поэтому на паузе и после остановки таймер не просыпается;
+    пока окно скрыто, запросы копятся и выполняются при показе.
+    """
+
+    def __init__(self, rate=10, parent=None):
+        super().__init__(parent)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._run)
+        self._dirty = {}  # обновление -> None, в порядке запроса
+        self._suspended = False
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        if not rate > 0:
+            rate = DEFAULT_REFRESH_RATE
+        self._timer.setInterval(max(1, round(1000 / min(rate, MAX_REFRESH_RATE))))
+
+    def schedule(self, update):
+        self._dirty[update] = None
+        if not self._suspended and not self._timer.isActive():
+            self._timer.start()
+
+    def set_suspended(self, suspended):
+        self._suspended = suspended
+        if suspended:
+            self._timer.stop()
+        elif self._dirty and not self._timer.isActive():
+            self._timer.start()
+
+    def _run(self):
+        dirty, self._dirty = self._dirty, {}
+        for update in dirty:
+            update()
+
+
+def format_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class PlaylistModel(QAbstractTableModel):
+    """
+    Модель плейлиста поверх списка номеров треков (см. tracks.TrackStore).
+    Название, исполнитель и длительность подгружаются лениво и только для тех
+    строк, которые показывает представление, и хранятся в столбцах TrackStore.
+    """
+    COLUMNS = ("Название", "Исполнитель", "Длительность")
+    ROWS_MIME_TYPE = 'application/x-pytune-rows'
+
+    track_info_changed = pyqtSignal(int, str, str)
+    rows_dropped = pyqtSignal(list, int)
+
+    def __init__(self, tracks, library, metadata_service, parent=None):
+        super().__init__(parent)
+        self.tracks = tracks
+        self.library = library
+        self.metadata_service = metadata_service
+        self._ids = []
+        self._rows = None  # номер трека -> строка или -1
+        self._pending = set()
+        self._requested = set()
+
+        self._fetch_timer = QTimer(self)
+        self._fetch_timer.setSingleShot(True)
+        self._fetch_timer.setInterval(30)
+        self._fetch_timer.timeout.connect(self._fetch_pending)
+
+    def set_ids(self, ids):
+        """Подключает модель к списку номеров; дальше он меняется только через модель."""
+        self.beginResetModel()
+        self._ids = ids
+        self._rows = None
+        self.endResetModel()
+
+    def append_ids(self, ids):
+        if not ids:
+            return
+        first = len(self._ids)
+        self.beginInsertRows(QModelIndex(), first, first + len(ids) - 1)
+        self._ids.extend(ids)
+        rows = self._rows
+        if rows is not None:
+            if len(rows) < len(self.tracks):
+                rows.extend(array('i', [-1]) * (len(self.tracks) - len(rows)))
+            for row, track_id in enumerate(ids, first):
+                rows[track_id] = row
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """
+        Удаляет строки одним проходом по списку; rows — отсортированные без повторов.
+        Сплошной диапазон удаляется обычным сигналом, разрозненные строки — сбросом
+        модели, чтобы представление не перестраивалось на каждую строку.
+        """
+        if not rows:
+            return []
+        removed = [self._ids[row] for row in rows]
+        contiguous = rows[-1] - rows[0] + 1 == len(rows)
+        if contiguous:
+            self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+            del self._ids[rows[0]:rows[-1] + 1]
+        else:
+            self.beginResetModel()
+            drop = set(rows)
+            self._ids[:] = [t for row, t in enumerate(self._ids) if row not in drop]
+        self._rows = None
+        if contiguous:
+            self.endRemoveRows()
+        else:
+            self.endResetModel()
+        for track_id in removed:
+            self.tracks.forget_info(track_id)
+            self._requested.discard(track_id)
+        return removed
+
+    def move_rows(self, rows, before_row):
+        """
+        Переносит строки rows (отсортированные) подряд перед строкой before_row.
+        Возвращает номер трека, перед которым они встали, или None, если в конец.
+        """
+        moving = set(rows)
+        while before_row < len(self._ids) and before_row in moving:
+            before_row += 1
+        before = self._ids[before_row] if before_row < len(self._ids) else None
+
+        self.beginResetModel()
+        moved = [self._ids[row] for row in rows]
+        rest = [t for row, t in enumerate(self._ids) if row not in moving]
+        pos = before_row - sum(1 for row in rows if row < before_row)
+        self._ids[:] = rest[:pos] + moved + rest[pos:]
+        self._rows = None
+        self.endResetModel()
+        return before
+
+    def replace_ids(self, pairs):
+        """
+        Ставит новые номера треков в строки старых, не меняя порядок:
+        pairs — пары (старый номер, новый номер).
+        """
+        for old, new in pairs:
+            row = self.row_of(old)
+            if row is None:
+                continue
+            self._ids[row] = new
+            rows = self._rows
+            if new >= len(rows):
+                rows.extend(array('i', [-1]) * (len(self.tracks) - len(rows)))
+            rows[old] = -1
+            rows[new] = row
+            self._requested.discard(old)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+    def track_id(self, row):
+        return self._ids[row]
+
+    def prefetch(self, ids):
+        """Заранее разбирает в фоне теги файлов, которых ещё нет в библиотеке."""
+        paths = self.tracks.paths(ids)
+        known = self.library.known_paths(paths)
+        for track_id, path in zip(ids, paths):
+            if path not in known and track_id not in self._requested:
+                self._requested.add(track_id)
+                self.metadata_service.request(path, priority=-1, with_cover=False)
+
+    def refresh(self, ids):
+        """Файлы изменились на диске: теги разбираются заново, строки обновятся по готовности."""
+        for track_id in ids:
+            self._requested.add(track_id)
+            self.metadata_service.request(self.tracks.path(track_id), priority=-1, with_cover=False)
+
+    def row_of(self, track_id):
+        """Строка трека или None; таблица строк перестраивается только после удалений."""
+        rows = self._rows
+        if rows is None:
+            rows = self._rows = array('i', [-1]) * len(self.tracks)
+            for row, t in enumerate(self._ids):
+                rows[t] = row
+        if track_id is None or track_id >= len(rows):
+            return None
+        row = rows[track_id]
+        return row if row >= 0 else None
+
+    def set_info(self, track_id, title, artist, duration):
+        self.tracks.set_info(track_id, title, artist, duration)
+        self._requested.discard(track_id)
+        self.track_info_changed.emit(track_id, title or "", artist or "")
+        row = self.row_of(track_id)
+        if row is not None:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    # --- перетаскивание строк ---
+
+    def flags(self, index):
+        if not index.isValid():
+            # Бросать можно только между строками
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return super().flags(index) | Qt.ItemFlag.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [self.ROWS_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        rows = sorted({index.row() for index in indexes})
+        data = QMimeData()
+        data.setData(self.ROWS_MIME_TYPE, ','.join(map(str, rows)).encode())
+        return data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(self.ROWS_MIME_TYPE):
+            return False
+        rows = [int(r) for r in bytes(data.data(self.ROWS_MIME_TYPE)).decode().split(',') if r]
+        if row < 0:
+            row = len(self._ids)
+        self.rows_dropped.emit(rows, row)
+        # Перенос уже сделан; True заставил бы представление ещё и удалить исходные строки
+        return False
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        track_id = self._ids[index.row()]
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.tracks.path(track_id)
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        info = self.tracks.info(track_id)
+        if info is None:
+            self._request(track_id)
+            return self.tracks.name(track_id) if index.column() == 0 else ""
+
+        title, artist, duration = info
+        if index.column() == 0:
+            return title
+        if index.column() == 1:
+            return artist
+        return format_time(duration) if duration else ""
+
+    def _request(self, track_id):
+        if track_id in self._requested:
+            return
+        self._requested.add(track_id)
+        self._pending.add(track_id)
+        if not self._fetch_timer.isActive():
+            self._fetch_timer.start()
+
+    def _fetch_pending(self):
+        # Строки сразу получают данные из библиотеки, а файлы проверяются в фоне:
+        # теги разбираются заново, только если файл изменился
+        pending, self._pending = list(self._pending), set()
+        paths = self.tracks.paths(pending)
+        records = self.library.records(paths)
+        for track_id, path in zip(pending, paths):
+            cached = records.get(path)
+            if cached is None:
+                self.metadata_service.request(path, with_cover=False)
+                continue
+            record, version = cached
+            self.set_info(track_id, record.title, record.artist, record.duration)
+            self.metadata_service.request(path, priority=-1, with_cover=False, known=version)
+
+
+class PlaylistFilterProxy(QAbstractProxyModel):
+    """
+    Показывает только треки, найденные поисковым индексом.
+
+    Отображение строк строится прямо из множества результатов, а не обходом
+    всего плейлиста, поэтому смена фильтра стоит O(k log k) от числа найденных.
+    Без фильтра строки проксируются один к одному.
+    """
+    # Большая разница между результатами применяется сбросом модели, а не по строке
+    MAX_ROW_CHANGES = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._matches = None
+        self._rows = []  # отсортированные строки источника, видимые при фильтре
+        self._removed = (0, 0)
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.dataChanged.connect(self._source_data_changed)
+        model.modelAboutToBeReset.connect(self.beginResetModel)
+        model.modelReset.connect(self._source_reset)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.rowsAboutToBeRemoved.connect(self._source_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self._source_rows_removed)
+
+    def set_matches(self, matches):
+        """
+        matches — множество номеров треков или None, чтобы показать весь плейлист.
+        Когда фильтр уже стоит, несколько появившихся и пропавших строк вставляются
+        и удаляются по одной: прокрутка и выделение в представлении сохраняются.
+        """
+        if matches is None or self._matches is None:
+            self.beginResetModel()
+            self._matches = matches
+            self._rebuild()
+            self.endResetModel()
+            return
+
+        rows = self._source_rows(matches)
+        self._matches = matches
+        if rows == self._rows:
+            return
+        old, new = set(self._rows), set(rows)
+        gone = sorted(old - new, reverse=True)
+        added = sorted(new - old)
+        if len(gone) + len(added) > self.MAX_ROW_CHANGES:
+            self.beginResetModel()
+            self._rows = rows
+            self.endResetModel()
+            return
+        for row in gone:
+            pos = bisect.bisect_left(self._rows, row)
+            self.beginRemoveRows(QModelIndex(), pos, pos)
+            del self._rows[pos]
+            self.endRemoveRows()
+        for row in added:
+            pos = bisect.bisect_left(self._rows, row)
+            self.beginInsertRows(QModelIndex(), pos, pos)
+            self._rows.insert(pos, row)
+            self.endInsertRows()
+
+    def _rebuild(self):
+        self._rows = [] if self._matches is None else self._source_rows(self._matches)
+
+    def _source_rows(self, matches):
+        source = self.sourceModel()
+        rows = (source.row_of(track_id) for track_id in matches)
+        return sorted(row for row in rows if row is not None)
+
+    # --- отображение строк ---
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        row = proxy_index.row()
+        if self._matches is not None:
+            row = self._rows[row]
+        return self.sourceModel().index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = source_index.row()
+        if self._matches is not None:
+            pos = bisect.bisect_left(self._rows, row)
+            if pos == len(self._rows) or self._rows[pos] != row:
+                return QModelIndex()
+            row = pos
+        return self.index(row, source_index.column())
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self._matches is None:
+            return self.sourceModel().rowCount()
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        return QModelIndex()
+
+    # --- изменения в источнике ---
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        first, last = top_left.row(), bottom_right.row()
+        if self._matches is not None:
+            first = bisect.bisect_left(self._rows, first)
+            last = bisect.bisect_right(self._rows, last) - 1
+            if first > last:
+                return
+        self.dataChanged.emit(self.index(first, top_left.column()),
+                              self.index(last, bottom_right.column()), roles)
+
+    def _source_reset(self):
+        self._rebuild()
+        self.endResetModel()
+
+    def _source_rows_inserted(self, parent, first, last):
+        count = last - first + 1
+        if self._matches is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+            self.endInsertRows()
+            return
+
+        source = self.sourceModel()
+        pos = bisect.bisect_left(self._rows, first)
+        added = [row for row in range(first, last + 1) if source.track_id(row) in self._matches]
+        shifted = [row + count for row in self._rows[pos:]]
+        if added:
+            self.beginInsertRows(QModelIndex(), pos, pos + len(added) - 1)
+        self._rows[pos:] = added + shifted
+        if added:
+            self.endInsertRows()
+
+    def _source_rows_about_to_be_removed(self, parent, first, last):
+        if self._matches is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            return
+        self._removed = (bisect.bisect_left(self._rows, first),
+                         bisect.bisect_right(self._rows, last))
+        if self._removed[0] < self._removed[1]:
+            self.beginRemoveRows(QModelIndex(), self._removed[0], self._removed[1] - 1)
+
+    def _source_rows_removed(self, parent, first, last):
+        if self._matches is None:
+            self.endRemoveRows()
+            return
+        count = last - first + 1
+        start, end = self._removed
+        self._rows[start:] = [row - count for row in self._rows[end:]]
+        if start < end:
+            self.endRemoveRows()
+
+
+class LyricsView(QTextEdit):
+    """
+    Текст песни. У текста с метками времени подсвечивается звучащая строка,
+    и окно прокручивается к ней. Подсветка сделана дополнительным выделением:
+    документ не меняется, перерисовываются только прежняя и новая строки.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self._synced = None
+        self._line = -1
+        self._highlight = QTextCharFormat()
+        self._highlight.setBackground(self.palette().color(QPalette.ColorRole.Highlight))
+        self._highlight.setForeground(self.palette().color(QPalette.ColorRole.HighlightedText))
+        self._highlight.setProperty(QTextFormat.Property.FullWidthSelection, True)
+
+    def set_lyrics(self, text):
+        self._synced = parse_lrc(text)
+        self._line = -1
+        self.setExtraSelections([])
+        if self._synced is not None:
+            self.setPlainText('\n'.join(self._synced.lines))
+        elif text:
+            self.setText(text)
+        else:
+            self.clear()
+
+    def set_position(self, position_ms):
+        if self._synced is None:
+            return
+        line = self._synced.line_at(position_ms)
+        if line == self._line:
+            return
+        self._line = line
+        if line < 0:
+            self.setExtraSelections([])
+            return
+
+        block = self.document().findBlockByNumber(line)
+        selection = QTextEdit.ExtraSelection()
+        selection.format = self._highlight
+        selection.cursor = QTextCursor(block)
+        selection.cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock,
+                                      QTextCursor.MoveMode.KeepAnchor)
+        self.setExtraSelections([selection])
+
+        # Звучащая строка держится посередине окна
+        rect = self.document().documentLayout().blockBoundingRect(block)
+        self.verticalScrollBar().setValue(int(rect.center().y() - self.viewport().height() / 2))
+
+
+class WaveformSlider(QSlider):
+    """
+    Полоса прокрутки с волновой формой трека; без пиков — обычный QSlider.
+    Столбцы для текущего размера сводятся один раз, а при движении позиции
+    перерисовывается только полоска между прежней и новой отметкой.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(Qt.Orientation.Horizontal, parent)
+        self._peaks = None
+        self._lines = None  # ((ширина, высота), линии столбцов)
+        self._position_x = 0
+
+    def set_peaks(self, peaks):
+        self._peaks = peaks if peaks is not None and len(peaks) else None
+        self._lines = None
+        self.setMinimumHeight(40 if self._peaks is not None else 0)
+        self.update()
+
+    def _value_x(self):
+        span = self.maximum() - self.minimum()
+        if span <= 0:
+            return 0
+        return int((self.value() - self.minimum()) * self.width() / span)
+
+    def sliderChange(self, change):
+        if self._peaks is None or change != QAbstractSlider.SliderChange.SliderValueChange:
+            super().sliderChange(change)
+            return
+        x = self._value_x()
+        if x != self._position_x:
+            left, right = sorted((x, self._position_x))
+            self._position_x = x
+            self.update(left - 1, 0, right - left + 2, self.height())
+
+    def _column_lines(self):
+        size = (self.width(), self.height())
+        if self._lines is None or self._lines[0] != size:
+            width, height = size
+            mins, maxs = waveform.column_extents(self._peaks, max(1, width))
+            middle = height / 2
+            scale = middle - 1
+            lines = [QLine(x, int(middle - top * scale), x, int(middle - bottom * scale))
+                     for x, (bottom, top) in enumerate(zip(mins, maxs))]
+            self._lines = (size, lines)
+        return self._lines[1]
+
+    def paintEvent(self, event):
+        if self._peaks is None:
+            super().paintEvent(event)
+            return
+        lines = self._column_lines()
+        played = self._position_x = self._value_x()
+        rect = event.rect()
+        first, last = max(0, rect.left()), min(len(lines), rect.right() + 1)
+
+        painter = QPainter(self)
+        painter.setPen(self.palette().color(QPalette.ColorRole.Highlight))
+        painter.drawLines(lines[first:max(first, min(last, played))])
+        painter.setPen(self.palette().color(QPalette.ColorRole.Mid))
+        painter.drawLines(lines[max(first, played):last])
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self._peaks is None or event.button() != Qt.MouseButton.LeftButton:
+            super().mousePressEvent(event)
+            return
+        self.setSliderDown(True)
+        self._seek_to(event.position().x())
+
+    def mouseMoveEvent(self, event):
+        if self._peaks is None or not self.isSliderDown():
+            super().mouseMoveEvent(event)
+            return
+        self._seek_to(event.position().x())
+
+    def mouseReleaseEvent(self, event):
+        if self._peaks is None or not self.isSliderDown():
+            super().mouseReleaseEvent(event)
+            return
+        self.setSliderDown(False)
+
+    def _seek_to(self, x):
+        fraction = min(1.0, max(0.0, x / max(1, self.width())))
+        self.setSliderPosition(self.minimum() + int(fraction * (self.maximum() - self.minimum())))
+
+
+class DebugView(QWidget):
+    """
+    Вкладка «Отладка»: итоги замеров, попадания в кэши и гистограмма
+    переключения треков. Пока вкладка видна, отчёт обновляется раз в секунду.
+    """
+
+    def __init__(self, tracer, cache_stats, parent=None):
+        super().__init__(parent)
+        self._tracer = tracer
+        self._cache_stats = cache_stats
+
+        self.report = QPlainTextEdit()
+        self.report.setReadOnly(True)
+        self.report.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.report.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+
+        save_btn = QPushButton('Сохранить трассу...')
+        save_btn.clicked.connect(self.save_trace)
+        reset_btn = QPushButton('Сбросить')
+        reset_btn.clicked.connect(self.reset)
+        buttons = QHBoxLayout()
+        buttons.addWidget(save_btn)
+        buttons.addWidget(reset_btn)
+        buttons.addStretch()
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.report)
+        layout.addLayout(buttons)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(1000)
+        self._timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self._timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._timer.stop()
+
+    def refresh(self):
+        lines = ['Замеры, мс:', f'  {"":24} {"число":>7} {"всего":>10} {"среднее":>8} {"макс.":>8}']
+        for name, count, total, average, peak in self._tracer.summary():
+            lines.append(f'  {name:24} {count:7d} {total:10.1f} {average:8.2f} {peak:8.1f}')
+
+        lines += ['', 'Кэши в памяти:']
+        for name, stats in self._cache_stats().items():
+            lines.append(f'  {name:24} записей {stats["entries"]:6d}, попаданий {stats["hit_rate"]:.0%}')
+
+        lines += ['', 'Переключение трека:']
+        histogram = self._tracer.histogram(TRACK_SWITCH)
+        if histogram is None:
+            lines.append('  нет данных')
+        else:
+            lines.append(f'  медиана {histogram.percentile(50):.1f} мс, '
+                         f'95-й перцентиль {histogram.percentile(95):.1f} мс')
+            widest = max(histogram.counts)
+            for label, count in histogram.rows():
+                lines.append(f'  {label:>10} {count:6d} {"█" * round(30 * count / widest)}')
+        self.report.setPlainText('\n'.join(lines))
+
+    def save_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, 'Сохранить трассу', 'pytune-trace.json', 'Chrome Trace (*.json)')
+        if not file_path:
+            return
+        try:
+            self._tracer.export_chrome_trace(file_path)
+        except OSError as e:
+            QMessageBox.warning(self, 'Трасса', f'Не удалось сохранить трассу: {e}')
+
+    def reset(self):
+        self._tracer.reset()
+        self.refresh()
+
+
+def _data_dir():
+    """Каталог для библиотеки и прочих данных пользователя."""
+    path = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+    return path or os.getcwd()
+
+
+def _cache_dir():
+    """Каталог для кэшей, которые можно удалить без потери данных."""
+    path = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    return path or os.path.join(_data_dir(), "cache")
 
 
 class PyTune(QWidget):
@@ -31,21 +1454,123 @@ class PyTune(QWidget):
         self.audio_output = QAudioOutput()
         self.player.setAudioOutput(self.audio_output)
 
+        # Второй плеер заранее открывает следующий трек, чтобы переход был без паузы
+        self.next_player = QMediaPlayer()
+        self.next_audio_output = QAudioOutput()
+        self.next_player.setAudioOutput(self.next_audio_output)
+        self._preloaded = None
+        self._upcoming_ticket = 0
+        self._fade_out = None
+
+        # Плейлист — список номеров треков; пути хранит self.tracks
+        self.tracks = TrackStore()
         self.playlist = []
         self.current_index = -1
 
         self.shuffle_mode = False
+        self.shuffle = ShuffleQueue()
         self.repeat_mode = 0
 
-        self.lyrics_cache = {}
+        # Метаданные с текстом песни по номеру трека и уменьшенные обложки по хэшу содержимого
+        self.track_cache = LRUCache(max_entries=TRACK_CACHE_ENTRIES, max_cost=TRACK_CACHE_BYTES,
+                                    cost=lambda meta: 256 + 2 * len(meta[3] or ""))
+        self.cover_cache = LRUCache(max_entries=COVER_CACHE_ENTRIES, max_cost=COVER_CACHE_BYTES,
+                                    cost=lambda pix: pix.width() * pix.height() * pix.depth() // 8)
+        self._placeholder_cover = None
+
+        self.library = LibraryStore(os.path.join(_data_dir(), "library.db"))
+
+        # Изменения плейлиста и позиция воспроизведения копятся в журнале
+        # и раз в секунду пишутся в базу из фонового потока
+        self.journal = PlaylistJournal(self.library.db_path)
+        self._journal_pool = QThreadPool(self)
+        self._journal_pool.setMaxThreadCount(1)
+        self._journal_task = _JournalFlushTask(self.journal)
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(1000)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start()
+
+        self.thumbnails = ThumbnailCache(os.path.join(_cache_dir(), "covers"),
+                                         THUMBNAIL_CACHE_BYTES)
+        self.metadata_service = MetadataService(self, self.thumbnails)
+        self.metadata_service.loaded.connect(self.track_info_loaded)
+        self.metadata_service.unchanged.connect(self.track_unchanged)
+        self.metadata_service.missing.connect(self.track_missing)
+        self.metadata_service.missing_files.connect(self.missing_files_found)
+        self._track_ticket = 0
+
+        self.waveforms = WaveformService(
+            ThumbnailCache(os.path.join(_cache_dir(), "waveforms"), WAVEFORM_CACHE_BYTES,
+                           suffix='.peaks'), self)
+        self.waveforms.ready.connect(self.waveform_ready)
+        self._waveform_path = None
+
+        # Разобранные теги пишутся в библиотеку пачками, а не по одному файлу
+        self._tag_writes = []
+        self.tag_write_timer = QTimer(self)
+        self.tag_write_timer.setSingleShot(True)
+        self.tag_write_timer.setInterval(500)
+        self.tag_write_timer.timeout.connect(self.flush_tag_writes)
+
+        self.folder_importer = FolderImporter(self)
+        self.folder_importer.batch_found.connect(self.import_batch)
+        self.folder_importer.finished.connect(self.import_finished)
+        self.import_progress = None
+        self._import_found = 0
+        self._import_added = 0
+
+        # Импортированные папки: пока включено наблюдение, новые, удалённые,
+        # переименованные и перезаписанные в них файлы сразу видны в плейлисте
+        self.imported_folders = []
+        self.watcher = LibraryWatcher(self)
+        self.watcher.scanned.connect(self.library_scanned)
+        self.watcher.changed.connect(self.folders_changed)
+        self._reconcile_roots = None
+        # Треки, файлы которых пропали: если файл вернётся, он снова считается новым
+        self._vanished = set()
 
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("Поиск трека...")
-        self.search_bar.textChanged.connect(self.filter_list)
-
-        self.list_widget = QListWidget()
+        self.search_index = SearchIndex()
+        self._search_index_built = False
+        self._filtered_text = ""
+
+        # Поиск запускается, когда пользователь перестал печатать
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.filter_list)
+        self.search_bar.textChanged.connect(lambda _: self.search_timer.start())
+
+        self.playlist_model = PlaylistModel(self.tracks, self.library, self.metadata_service, self)
+        self.playlist_model.set_ids(self.playlist)
+        self.playlist_model.track_info_changed.connect(self.index_track)
+        self.playlist_proxy = PlaylistFilterProxy(self)
+        self.playlist_proxy.setSourceModel(self.playlist_model)
+
+        self.playlist_view = QTableView()
+        self.playlist_view.setModel(self.playlist_proxy)
+        self.playlist_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.playlist_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.playlist_view.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.playlist_view.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.playlist_view.setDropIndicatorShown(True)
+        self.playlist_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.playlist_view.setShowGrid(False)
+        self.playlist_view.setWordWrap(False)
+        # Фиксированная высота строк: представлению не нужно измерять весь плейлист
+        self.playlist_view.verticalHeader().hide()
+        self.playlist_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        header = self.playlist_view.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Interactive)
+        header.setSectionResizeMode(2, QHeaderView.ResizeMode.Fixed)
+        header.resizeSection(1, 250)
+        header.resizeSection(2, 100)
 
         self.open_btn = QPushButton('Открыть')
+        self.folder_btn = QPushButton('Папка')
         self.delete_btn = QPushButton('Удалить')
         self.play_btn = QPushButton('▶')
         self.stop_btn = QPushButton('■')
@@ -54,7 +1579,7 @@ class PyTune(QWidget):
         self.shuffle_btn = QPushButton('🔀')
         self.repeat_btn = QPushButton('🔁')
 
-        self.position_slider = QSlider(Qt.Orientation.Horizontal)
+        self.position_slider = WaveformSlider()
         self.position_slider.setRange(0, 0)
 
         self.volume_slider = QSlider(Qt.Orientation.Horizontal)
@@ -64,6 +1589,11 @@ class PyTune(QWidget):
 
         self.time_label = QLabel('00:00 / 00:00')
 
+        self.crossfade_spin = QSpinBox()
+        self.crossfade_spin.setRange(0, 10)
+        self.crossfade_spin.setSuffix(' с')
+        self.crossfade_spin.setToolTip('Плавный переход между треками')
+
         self.tab_widget = QTabWidget()
 
         cover_container = QWidget()
@@ -81,11 +1611,19 @@ class PyTune(QWidget):
         self.tab_widget.addTab(cover_container, "Обложка")
 
 
-        self.lyrics_text = QTextEdit()
-        self.lyrics_text.setReadOnly(True)
+        self.lyrics_text = LyricsView()
         self.lyrics_text.setPlaceholderText("Текст песни отсутствует")
         self.tab_widget.addTab(self.lyrics_text, "Текст")
 
+        # Скрытая вкладка с замерами: видна при PYTUNE_TRACE=1 или по Ctrl+Shift+D
+        self.debug_view = DebugView(tracer, self.cache_stats)
+        if tracer.enabled:
+            self.tab_widget.addTab(self.debug_view, "Отладка")
+        debug_action = QAction(self)
+        debug_action.setShortcut(QKeySequence('Ctrl+Shift+D'))
+        debug_action.triggered.connect(self.toggle_debug)
+        self.addAction(debug_action)
+
         self.title_label = QLabel("—")
         self.title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.title_label.setStyleSheet("font-weight: bold; font-size: 14px; margin-top: 5px;")
@@ -103,6 +1641,7 @@ class PyTune(QWidget):
 
         controls_layout = QHBoxLayout()
         controls_layout.addWidget(self.open_btn)
+        controls_layout.addWidget(self.folder_btn)
         controls_layout.addWidget(self.delete_btn)
         controls_layout.addWidget(self.prev_btn)
         controls_layout.addWidget(self.play_btn)
@@ -112,12 +1651,14 @@ class PyTune(QWidget):
         controls_layout.addWidget(self.repeat_btn)
 
         controls_layout.addStretch()
+        controls_layout.addWidget(QLabel('Переход'))
+        controls_layout.addWidget(self.crossfade_spin)
         controls_layout.addWidget(QLabel('Громкость'))
         controls_layout.addWidget(self.volume_slider)
 
         left_layout = QVBoxLayout()
         left_layout.addWidget(self.search_bar)
-        left_layout.addWidget(self.list_widget)
+        left_layout.addWidget(self.playlist_view)
         left_layout.addLayout(controls_layout)
         left_layout.addWidget(self.position_slider)
         left_layout.addWidget(self.time_label)
@@ -128,12 +1669,30 @@ class PyTune(QWidget):
         self.setLayout(main_layout)
 
         self.open_btn.clicked.connect(self.open_files)
+        self.folder_btn.clicked.connect(self.open_folder)
         self.delete_btn.clicked.connect(self.delete_selected)
+        self.playlist_model.rows_dropped.connect(self.move_rows)
+
+        self.playlist_view.setContextMenuPolicy(Qt.ContextMenuPolicy.ActionsContextMenu)
+        for text, slot, shortcut in (
+                ('Удалить выбранные', self.delete_selected, QKeySequence.StandardKey.Delete),
+                ('Удалить отсутствующие файлы', self.remove_missing, None),
+                ('Удалить дубликаты', self.remove_duplicates, None)):
+            action = QAction(text, self.playlist_view)
+            if shortcut is not None:
+                action.setShortcut(shortcut)
+                action.setShortcutContext(Qt.ShortcutContext.WidgetShortcut)
+            action.triggered.connect(slot)
+            self.playlist_view.addAction(action)
+        self.watch_action = QAction('Следить за изменениями в папках', self.playlist_view)
+        self.watch_action.setCheckable(True)
+        self.watch_action.triggered.connect(self.set_watching)
+        self.playlist_view.addAction(self.watch_action)
         self.play_btn.clicked.connect(self.play_pause)
         self.stop_btn.clicked.connect(self.stop)
         self.prev_btn.clicked.connect(self.prev_track)
         self.next_btn.clicked.connect(self.next_track)
-        self.list_widget.itemDoubleClicked.connect(self.list_double_clicked)
+        self.playlist_view.doubleClicked.connect(self.list_double_clicked)
 
         self.position_slider.sliderMoved.connect(self.seek)
         self.volume_slider.valueChanged.connect(self.change_volume)
@@ -141,221 +1700,290 @@ class PyTune(QWidget):
         self.shuffle_btn.clicked.connect(self.toggle_shuffle)
         self.repeat_btn.clicked.connect(self.toggle_repeat)
 
-        self.player.positionChanged.connect(self.position_changed)
-        self.player.durationChanged.connect(self.duration_changed)
-        self.player.playbackStateChanged.connect(self.update_play_button)
-        self.player.mediaStatusChanged.connect(self.media_status_changed)
+        self._connect_player(self.player)
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_time_label)
-        self.timer.start(500)
+        self.preload_timer = QTimer(self)
+        self.preload_timer.setSingleShot(True)
+        self.preload_timer.setInterval(2000)
+        self.preload_timer.timeout.connect(self.preload_next)
 
-        self.load_playlist()
+        self.fade_timer = QTimer(self)
+        self.fade_timer.setInterval(50)
+        self.fade_timer.timeout.connect(self._fade_step)
 
-    def _extract_metadata(self, file_path):
-        """
-        Извлекает название, исполнителя и обложку из аудиофайла.
-        """
-        ext = os.path.splitext(file_path)[1].lower()
-        title = None
-        artist = None
-        cover_data = None
+        self.refresh = RefreshScheduler(REFRESH_RATE, self)
+        self._time_text = self.time_label.text()
 
-        try:
-            if ext == '.mp3':
-                audio = MP3(file_path, ID3=ID3)
-                if audio.tags:
-                    for tag in audio.tags.values():
-                        if isinstance(tag, TIT2):
-                            title = str(tag.text[0])
-                        elif isinstance(tag, TPE1):
-                            artist = str(tag.text[0])
-                        elif isinstance(tag, APIC):
-                            cover_data = tag.data
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", cover_data
-
-            elif ext == '.flac':
-                audio = FLAC(file_path)
-                title = audio.get('title', [None])[0]
-                artist = audio.get('artist', [None])[0]
-                if audio.pictures:
-                    cover_data = audio.pictures[0].data
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", cover_data
-
-            elif ext in ('.m4a', '.mp4', '.aac'):
-                audio = MP4(file_path)
-                title_list = audio.get('\xa9nam', [])
-                if title_list:
-                    title = str(title_list[0])
-                artist_list = audio.get('\xa9ART', [])
-                if artist_list:
-                    artist = str(artist_list[0])
-                covr = audio.get('covr', [])
-                if covr:
-                    cover_data = covr[0]
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", cover_data
-
-            elif ext in ('.wma', '.asf'):
-                audio = ASF(file_path)
-                title = audio.get('Title', [None])[0]
-                artist = audio.get('Author', [None])[0]
-                pic = audio.get('WM/Picture', [None])[0]
-                if pic:
-                    cover_data = pic.data
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", cover_data
-
-            elif ext in ('.ogg', '.opus'):
-                if ext == '.ogg':
-                    audio = OggVorbis(file_path)
-                else:
-                    audio = OggOpus(file_path)
-                title = audio.get('title', [None])[0]
-                artist = audio.get('artist', [None])[0]
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", None
-
-            elif ext == '.wav':
-                audio = WAVE(file_path)
-                if audio.tags:
-                    for tag in audio.tags.values():
-                        if isinstance(tag, TIT2):
-                            title = str(tag.text[0])
-                        elif isinstance(tag, TPE1):
-                            artist = str(tag.text[0])
-                        elif isinstance(tag, APIC):
-                            cover_data = tag.data
-                if not title:
-                    title = os.path.basename(file_path)
-                return title, artist or "", cover_data
+        # Плейлист и обложка последнего трека восстанавливаются после первой отрисовки окна
+        self._restore_pending = True
+        self._session_restored = False
+        self._pending_messages = []
 
-            else:
-                return os.path.basename(file_path), "", None
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh.set_suspended(False)
 
-        except Exception as e:
-            print(f"Ошибка чтения метаданных из {file_path}: {e}")
-            return os.path.basename(file_path), "", None
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh.set_suspended(True)
 
-    def _get_lyrics(self, file_path):
-        """Извлекает текст песни из аудиофайла"""
-        if file_path in self.lyrics_cache:
-            return self.lyrics_cache[file_path]
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.refresh.set_suspended(self.isMinimized())
 
-        ext = os.path.splitext(file_path)[1].lower()
-        lyrics = None
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._restore_pending:
+            self._restore_pending = False
+            startup_mark("first paint")
+            QTimer.singleShot(0, self.restore_session)
 
-        try:
-            if ext == '.mp3':
-                audio = MP3(file_path, ID3=ID3)
-                if audio.tags:
-                    # Ищем USLT
-                    for tag in audio.tags.values():
-                        if isinstance(tag, USLT):
-                            lyrics = tag.text
-                            break
-                    if not lyrics:
-                        for tag in audio.tags.values():
-                            if isinstance(tag, TXXX) and tag.desc.upper() == 'LYRICS':
-                                lyrics = tag.text[0]
-                                break
-
-            elif ext == '.flac':
-                audio = FLAC(file_path)
-                lyrics = audio.get('lyrics', [None])[0]
-
-            elif ext in ('.ogg', '.opus'):
-                if ext == '.ogg':
-                    audio = OggVorbis(file_path)
-                else:
-                    audio = OggOpus(file_path)
-                lyrics = audio.get('lyrics', [None])[0]
-
-            elif ext in ('.m4a', '.mp4'):
-                audio = MP4(file_path)
-                lyrics_list = audio.get('\xa9lyr', [])
-                if lyrics_list:
-                    lyrics = lyrics_list[0]
-                else:
-                    for key, value in audio.items():
-                        if key.startswith('----:') and 'LYRICS' in key.upper():
-                            lyrics = value[0].decode('utf-8', errors='ignore')
-                            break
-
-            elif ext in ('.wma', '.asf'):
-                audio = ASF(file_path)
-                lyrics = audio.get('WM/Lyrics', [None])[0]
-
-            elif ext == '.wav':
-                audio = WAVE(file_path)
-                if audio.tags:
-                    for tag in audio.tags.values():
-                        if isinstance(tag, USLT):
-                            lyrics = tag.text
-                            break
+    def restore_session(self):
+        self.load_playlist()
+        self._session_restored = True
+        startup_mark("playlist restored")
+        messages, self._pending_messages = self._pending_messages, []
+        for message in messages:
+            self.handle_message(message)
 
-        except Exception as e:
-            print(f"Ошибка извлечения текста из {file_path}: {e}")
+    def handle_message(self, message):
+        """
+        Файлы и команда из командной строки: своей или повторного запуска плеера.
+        Открытые файлы добавляются в плейлист, и первый из них начинает играть.
+        """
+        if not self._session_restored:
+            self._pending_messages.append(message)
+            return
 
-        if isinstance(lyrics, list):
-            lyrics = '\n'.join(lyrics)
+        paths = message.get('files') or []
+        folders = [p for p in paths if os.path.isdir(p)]
+        files = [p for p in paths if os.path.isfile(p)]
+        if files:
+            self.add_tracks(files)
+            row = self.playlist_model.row_of(self.tracks.find(files[0]))
+            if row is not None and row != self.current_index:
+                self.current_index = row
+                self.play_file(files[0])
+        if folders:
+            self.import_folders(folders)
+
+        command = message.get('command')
+        if command == 'play-pause':
+            self.play_pause()
+        elif command == 'next':
+            self.next_track()
+        elif command == 'prev':
+            self.prev_track()
+        elif command == 'stop':
+            self.stop()
 
-        self.lyrics_cache[file_path] = lyrics
-        return lyrics
+        if command is None:
+            self.showNormal()
+            self.raise_()
+            self.activateWindow()
 
-    def update_cover(self, file_path):
-        """Обновляет обложку и информацию о треке."""
-        title, artist, cover_data = self._extract_metadata(file_path)
-        self.title_label.setText(title)
-        self.artist_label.setText(artist)
+    def request_track_info(self, file_path):
+        """
+        Показывает метаданные трека из кэша или библиотеки и запрашивает в фоне
+        проверку файла: если он менялся или его обложки нет в кэше, теги разбираются
+        заново. Сам файл здесь не открывается: на сетевом диске это долго.
+        """
+        self.metadata_service.cancel(self._track_ticket)
+        self._track_ticket = 0
+        self.watcher.follow(file_path)
+
+        meta = self.cached_metadata(file_path)
+        if meta is not None:
+            title, artist, duration, lyrics, cover_id = meta
+            pixmap = self.cover_pixmap(cover_id)
+            self.update_cover(title, artist, pixmap)
+            self.update_lyrics(lyrics)
+            if pixmap is not None or cover_id is None:
+                # Данные уже показаны; в фоне проверяется, что файл тот же, и читается .lrc
+                self._track_ticket = self.metadata_service.request(
+                    file_path, priority=1, known=self.file_version(file_path))
+                tracer.end(TRACK_SWITCH)
+                return
+
+        # Текущий трек важнее строк плейлиста, которые ждут своей очереди
+        self._track_ticket = self.metadata_service.request(file_path, priority=1)
 
-        if cover_data:
-            pixmap = QPixmap()
-            if pixmap.loadFromData(cover_data):
-                scaled = pixmap.scaled(200, 200,
+    def cached_metadata(self, file_path):
+        """
+        (title, artist, duration, lyrics, cover_hash) из памяти или из библиотеки.
+        Файл не проверяется: это делает фоновый разбор с версией из file_version.
+        """
+        track_id = self.tracks.add(file_path)
+        meta = self.track_cache.get(track_id)
+        if meta is None:
+            with tracer.span('library lookup'):
+                cached = self.library.records([file_path]).get(file_path)
+            if cached is not None:
+                record = cached[0]
+                meta = (record.title, record.artist, record.duration, record.lyrics,
+                        record.cover_hash)
+                self.track_cache.put(track_id, meta)
+        return meta
+
+    def file_version(self, file_path):
+        """(размер, время изменения) файла по библиотеке, или None, если его там нет."""
+        return self.library.versions([file_path]).get(file_path)
+
+    def cover_pixmap(self, cover_id, cover_data=None):
+        """
+        Уменьшенная обложка: из памяти, из дискового кэша миниатюр или из cover_data.
+        Одинаковая обложка альбома декодируется один раз. None, если обложки нет
+        или она ещё не читалась (пустой cover_id).
+        """
+        if not cover_id:
+            return None
+        pixmap = self.cover_cache.get(cover_id)
+        if pixmap is None and not cover_data:
+            with tracer.span('thumbnail cache'):
+                cover_data = self.thumbnails.get(cover_id)
+        if pixmap is None and cover_data:
+            with tracer.span('cover decode'):
+                pixmap = QPixmap()
+                if not pixmap.loadFromData(cover_data):
+                    return None
+                pixmap = pixmap.scaled(COVER_SIZE, COVER_SIZE,
                                        Qt.AspectRatioMode.KeepAspectRatio,
                                        Qt.TransformationMode.SmoothTransformation)
-                self.cover_label.setPixmap(scaled)
-                return
+            self.cover_cache.put(cover_id, pixmap)
+        return pixmap
+
+    def toggle_debug(self):
+        """Показывает вкладку «Отладка» и включает замеры или скрывает и выключает."""
+        index = self.tab_widget.indexOf(self.debug_view)
+        if index == -1:
+            tracer.set_enabled(True)
+            self.tab_widget.setCurrentIndex(self.tab_widget.addTab(self.debug_view, "Отладка"))
+        else:
+            self.tab_widget.removeTab(index)
+            tracer.set_enabled(False)
+
+    def cache_stats(self):
+        """Заполненность и попадания кэшей в памяти."""
+        return {
+            "tracks": self.track_cache.stats(),
+            "covers": self.cover_cache.stats(),
+        }
+
+    def track_info_loaded(self, ticket, file_path, info, stat):
+        title, artist, duration, lyrics = info.title, info.artist, info.duration, info.lyrics
+        cover_data, cover_id = info.cover, info.cover_hash
+        if stat is not None:
+            self._tag_writes.append((file_path, stat, title, artist, duration, lyrics, cover_id))
+            if not self.tag_write_timer.isActive():
+                self.tag_write_timer.start()
+        track_id = self.tracks.add(file_path)
+        self.playlist_model.set_info(track_id, title, artist, duration)
+
+        if ticket == self._upcoming_ticket:
+            # Прогрев кэшей: переход на этот трек обойдётся без разбора файла
+            self.track_cache.put(track_id, (title, artist, duration, lyrics, cover_id))
+            self.cover_pixmap(cover_id, cover_data)
+            return
+        # Пока файл разбирался, пользователь мог переключить трек
+        if ticket != self._track_ticket:
+            # Файл мог измениться: прежние данные в памяти больше не годятся
+            self.track_cache.discard(track_id)
+            return
+        self.track_cache.put(track_id, (title, artist, duration, lyrics, cover_id))
+        self.update_cover(title, artist, self.cover_pixmap(cover_id, cover_data))
+        self.update_lyrics(choose_lyrics(lyrics, info.sidecar))
+        tracer.end(TRACK_SWITCH)
+
+    def track_unchanged(self, ticket, file_path, sidecar):
+        """Файл играющего трека не менялся: показанные данные верны, остаётся текст .lrc."""
+        if ticket != self._track_ticket or not sidecar:
+            return
+        meta = self.cached_metadata(file_path)
+        lyrics = choose_lyrics(meta[3] if meta is not None else None, sidecar)
+        if lyrics is sidecar:
+            self.update_lyrics(lyrics)
 
+    def track_missing(self, ticket, file_path):
+        if ticket != self._track_ticket:
+            return
+        # Файл удалили или перенесли, пока плеер о нём не знал
+        self.player.stop()
         self.set_default_cover()
+        self.title_label.setText(f"Файл не найден: {os.path.basename(file_path)}")
+        tracer.end(TRACK_SWITCH)
 
-    def update_lyrics(self, file_path):
-        """Обновляет отображаемый текст песни."""
-        lyrics = self._get_lyrics(file_path)
-        if lyrics:
-            self.lyrics_text.setText(lyrics)
-        else:
-            self.lyrics_text.clear()
+    def flush_tag_writes(self):
+        writes, self._tag_writes = self._tag_writes, []
+        if writes:
+            self.library.store_many(writes)
+
+    def update_cover(self, title, artist, pixmap):
+        """Обновляет обложку и информацию о треке."""
+        self.title_label.setText(title)
+        self.artist_label.setText(artist)
+        self.cover_label.setPixmap(pixmap if pixmap is not None else self.placeholder_cover())
+
+    def placeholder_cover(self):
+        if self._placeholder_cover is None:
+            self._placeholder_cover = QPixmap(COVER_SIZE, COVER_SIZE)
+            self._placeholder_cover.fill(Qt.GlobalColor.lightGray)
+        return self._placeholder_cover
+
+    def update_lyrics(self, lyrics):
+        """
+        Обновляет отображаемый текст песни. Файл .lrc рядом с треком
+        читается в фоне вместе с тегами, выбор делает choose_lyrics.
+        """
+        with tracer.span('lyrics'):
+            self.lyrics_text.set_lyrics(lyrics)
+            self.lyrics_text.set_position(self.player.position())
 
     def set_default_cover(self):
         """Устанавливает заглушку для обложки и очищает текст."""
-        pix = QPixmap(200, 200)
-        pix.fill(Qt.GlobalColor.lightGray)
-        self.cover_label.setPixmap(pix)
+        self.cover_label.setPixmap(self.placeholder_cover())
         self.title_label.setText("—")
         self.artist_label.setText("")
-        self.lyrics_text.clear()
-
-    def filter_list(self, text):
-        text = text.lower().strip()
-        for i in range(self.list_widget.count()):
-            item = self.list_widget.item(i)
-            track = item.text().lower()
-            filename = os.path.basename(track)
-            match = text in filename.lower()
-            item.setHidden(not match)
+        self.lyrics_text.set_lyrics(None)
+
+    def build_search_index(self):
+        """Строит поисковый индекс при первом поиске; дальше он обновляется по ходу."""
+        tags = self.library.load_tags()
+        tracks = self.tracks
+        self.search_index.add_many(
+            (track_id, tracks.name(track_id), *tags.get(tracks.path(track_id), (None, None)))
+            for track_id in self.playlist)
+        self._search_index_built = True
+
+    def index_track(self, track_id, title, artist):
+        if self._search_index_built:
+            if self.search_index.add(track_id, self.tracks.name(track_id), title, artist):
+                self.requery_search()
+
+    def requery_search(self):
+        """
+        Трек вошёл в результаты активного поиска или выпал из них: прокси держит
+        копию результатов, поэтому запрос повторяется с той же задержкой, что и при наборе.
+        """
+        if (self._search_index_built and self.search_bar.text().strip()
+                and not self.search_timer.isActive()):
+            self.search_timer.start()
+
+    def filter_list(self):
+        text = self.search_bar.text()
+        if not self._search_index_built and text.strip():
+            self.build_search_index()
+        self.playlist_proxy.set_matches(self.search_index.search(text))
+        # Повтор того же запроса не должен уводить прокрутку и выделение к играющему треку
+        if text != self._filtered_text:
+            self._filtered_text = text
+            self.highlight_current()
 
     def toggle_shuffle(self):
         self.shuffle_mode = not self.shuffle_mode
         self.shuffle_btn.setStyleSheet("background: lightgreen;" if self.shuffle_mode else "")
+        # Следующий трек зависит от режима, предзагрузку нужно обновить
+        self.preload_timer.start()
 
     def toggle_repeat(self):
         self.repeat_mode = (self.repeat_mode + 1) % 3
@@ -365,60 +1993,450 @@ class PyTune(QWidget):
             self.repeat_btn.setText("🔂")
         else:
             self.repeat_btn.setText("🔁∞")
+        self.preload_timer.start()
 
     def open_files(self):
         files, _ = QFileDialog.getOpenFileNames(
             self,
             'Открыть аудио-файлы',
             '',
-            'Audio Files (*.mp3 *.wav *.flac *.ogg *.opus *.aac *.m4a *.wma);;All Files (*)'
+            'Audio Files (%s);;All Files (*)' % ' '.join('*' + ext for ext in AUDIO_EXTENSIONS)
         )
         if not files:
             return
-
-        for f in files:
-            if f not in self.playlist:
-                self.playlist.append(f)
-                self.list_widget.addItem(f)
-
-        if self.current_index == -1 and self.playlist:
+        self.add_tracks(files)
+
+    def open_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, 'Добавить папку')
+        if folder:
+            self.import_folders([folder])
+
+    def import_folders(self, folders):
+        self.remember_folders(folders)
+        self._import_found = self._import_added = 0
+        # Окно прежнего импорта закрывается сразу: его finished уже отфильтрует билет
+        self.close_import_progress()
+        self.import_progress = QProgressDialog('Поиск аудиофайлов...', 'Отмена', 0, 0, self)
+        self.import_progress.setWindowTitle('Импорт')
+        self.import_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.import_progress.canceled.connect(self.folder_importer.cancel)
+        self.import_progress.show()
+        self.folder_importer.start(folders)
+
+    def import_batch(self, paths):
+        added = self.add_tracks(paths)
+        self._import_found += len(paths)
+        self._import_added += len(added)
+        if self.import_progress is not None:
+            self.import_progress.setLabelText(
+                f'Найдено файлов: {self._import_found}, добавлено: {self._import_added}')
+
+    def import_finished(self):
+        self.close_import_progress()
+
+    def close_import_progress(self):
+        if self.import_progress is not None:
+            self.import_progress.canceled.disconnect()
+            self.import_progress.close()
+            self.import_progress.deleteLater()
+            self.import_progress = None
+
+    def add_tracks(self, paths, autoplay=True):
+        """
+        Добавляет в конец плейлиста треки, которых в нём ещё нет;
+        возвращает номера добавленных. Если ничего не играло, с autoplay
+        начинает играть первый трек.
+        """
+        added = []
+        seen = set()
+        for path in paths:
+            track_id = self.tracks.add(path)
+            if track_id not in seen and self.playlist_model.row_of(track_id) is None:
+                seen.add(track_id)
+                added.append(track_id)
+        if not added:
+            return added
+
+        # Новые строки при активном поиске появятся после повтора запроса
+        for track_id in added:
+            self.index_track(track_id, None, None)
+        self.playlist_model.append_ids(added)
+        self.shuffle.add(added)
+        self.journal.add(self.tracks.paths(added))
+        self.playlist_model.prefetch(added)
+
+        if autoplay and self.current_index == -1:
             self.current_index = 0
-            self.play_file(self.playlist[self.current_index])
+            self.play_file(self.path_at(self.current_index))
+        return added
+
+    def remember_folders(self, folders):
+        """Запоминает импортированные папки; вложенные в уже известные не дублируются."""
+        roots = list(self.imported_folders)
+        for folder in folders:
+            if any(folder == root or folder.startswith(os.path.join(root, '')) for root in roots):
+                continue
+            prefix = os.path.join(folder, '')
+            roots = [root for root in roots if not root.startswith(prefix)] + [folder]
+        if roots != self.imported_folders:
+            self.imported_folders = roots
+            if self.watch_action.isChecked():
+                self.watcher.watch(roots)
+
+    def set_watching(self, enabled):
+        """Включает или выключает наблюдение за импортированными папками."""
+        # Пока наблюдение было выключено или плеер закрыт, файлы могли появиться
+        # и пропасть: первый обход сверяется с плейлистом
+        self._reconcile_roots = list(self.imported_folders) if enabled else None
+        self.watcher.watch(self.imported_folders if enabled else [])
+
+    def library_scanned(self, files):
+        """
+        Первый обход наблюдаемых папок. Каталоги, где есть файлы, которых нет ни
+        в плейлисте, ни в библиотеке, или где пропали файлы треков плейлиста,
+        сверяются так же, как изменения на лету. Остальные файлы только
+        запоминаются: убранные пользователем треки не возвращаются.
+        """
+        reconcile = self._reconcile_roots is not None and self._reconcile_roots == self.watcher.roots
+        self._reconcile_roots = None
+        if not reconcile:
+            # Папки добавил идущий импорт: их файлы он добавит сам
+            self.tracks.add_many(files)
+            return
+        unknown = []
+        on_disk = set()
+        for path in files:
+            track_id = self.tracks.find(path)
+            if track_id is None:
+                unknown.append(path)
+            else:
+                on_disk.add(track_id)
+        known = self.library.known_paths(unknown)
+        self.tracks.add_many(path for path in unknown if path in known)
+        folders = {os.path.dirname(path) for path in unknown if path not in known}
+        for track_id in self.playlist:
+            if track_id not in on_disk:
+                folder = os.path.dirname(self.tracks.path(track_id))
+                if self.watcher.root_of(folder) is not None:
+                    folders.add(folder)
+        if folders:
+            self.watcher.recheck(folders)
+
+    def folders_changed(self, listing, vanished):
+        """
+        Сверяет с плейлистом каталоги, которые наблюдатель просмотрел в фоне.
+        Новые файлы добавляются в конец, пропавшие убираются, переименованные
+        и перенесённые остаются в своих строках, а у перезаписанных файлов
+        заново разбираются теги. Диск здесь не читается: версии файлов уже в listing.
+        """
+        found = []  # новые файлы
+        gone = set()  # номера треков, файлы которых пропали
+        kept = []  # (путь, номер) треков плейлиста, файлы которых на месте
+        disk = {}  # путь -> (размер, время изменения)
+        for folder in vanished:
+            # Каталог удалили или перенесли вместе с подкаталогами
+            gone.update(self.tracks.folder_tracks(folder, recursive=True))
+        for folder, entries in listing.items():
+            on_disk = set()
+            for path, version in entries:
+                disk[path] = version
+                track_id = self.tracks.find(path)
+                if track_id is None or track_id in self._vanished:
+                    found.append(path)
+                    continue
+                on_disk.add(track_id)
+                if self.playlist_model.row_of(track_id) is not None:
+                    kept.append((path, track_id))
+            gone.update(t for t in self.tracks.folder_tracks(folder) if t not in on_disk)
+
+        gone -= self._vanished
+        self._vanished |= gone
+        missing = [t for t in gone if self.playlist_model.row_of(t) is not None]
+        renames = self._find_renames(missing, found, disk)
+        if renames:
+            self.rename_tracks(renames)
+            renamed = {old for old, _ in renames}
+            moved = {self.tracks.path(new) for _, new in renames}
+            missing = [t for t in missing if t not in renamed]
+            found = [path for path in found if path not in moved]
+        # Изменения на диске не должны запускать воспроизведение
+        self.remove_rows([self.playlist_model.row_of(t) for t in missing], play=False)
+        self.add_tracks(found, autoplay=False)
+        self._vanished.difference_update(self.tracks.find(path) for path in found)
+        self._vanished.difference_update(new for _, new in renames)
+        self.refresh_tracks(self._changed_tracks(kept, disk))
+
+    def _find_renames(self, gone, found, disk):
+        """
+        Пары (старый номер, новый номер) для пропавших треков, которые нашлись
+        под другим путём: размер и время изменения файла (disk) совпадают
+        с разобранной версией. Из равных кандидатов выбирается файл с тем же именем.
+        """
+        versions = self.library.versions(self.tracks.paths(gone))
+        candidates = {}
+        for path in found:
+            candidates.setdefault(disk[path], []).append(path)
+        renames = []
+        for track_id in gone:
+            old_path = self.tracks.path(track_id)
+            paths = candidates.get(versions.get(old_path))
+            if not paths:
+                continue
+            name = os.path.basename(old_path)
+            new_path = next((p for p in paths if os.path.basename(p) == name), paths[0])
+            paths.remove(new_path)
+            renames.append((track_id, self.tracks.add(new_path)))
+        return renames
+
+    def _changed_tracks(self, kept, disk):
+        """Номера треков, файлы которых изменились после разбора в библиотеку."""
+        versions = self.library.versions(path for path, _ in kept)
+        changed = []
+        for path, track_id in kept:
+            version = versions.get(path)
+            if version is not None and version != disk[path]:
+                changed.append(track_id)
+        return changed
+
+    def rename_tracks(self, renames):
+        """
+        Файлы треков переименовали или перенесли: строки плейлиста остаются
+        на местах и получают новые пути. renames — пары номеров (старый, новый).
+        """
+        current = self.playlist[self.current_index] if self.current_index >= 0 else None
+        self.playlist_model.replace_ids(renames)
+        self.journal.rename([(self.tracks.path(old), self.tracks.path(new))
+                             for old, new in renames])
+        self.shuffle.remove([old for old, _ in renames])
+        self.shuffle.add([new for _, new in renames])
+        if self.search_index.remove_many([old for old, _ in renames]):
+            self.requery_search()
+        for old, new in renames:
+            # Содержимое файла то же: теги и текст переходят к новому пути без разбора
+            info = self.tracks.info(old)
+            if info is not None:
+                self.tracks.set_info(new, *info)
+            meta = self.track_cache.get(old)
+            if meta is not None:
+                self.track_cache.discard(old)
+                self.track_cache.put(new, meta)
+            self.index_track(new, *(info[:2] if info is not None else (None, None)))
+            if old == current:
+                self.shuffle.played(new)
+                self.watcher.follow(self.tracks.path(new))
+
+    def refresh_tracks(self, ids):
+        """
+        Файлы треков перезаписали (например, записали новые теги):
+        кэши сбрасываются, и теги разбираются заново.
+        """
+        if not ids:
+            return
+        current = self.playlist[self.current_index] if self.current_index >= 0 else None
+        for track_id in ids:
+            self.track_cache.discard(track_id)
+        self.playlist_model.refresh([t for t in ids if t != current])
+        if current in ids:
+            # Обложка и текст играющего трека перечитываются сразу
+            self.request_track_info(self.tracks.path(current))
 
     def delete_selected(self):
-        row = self.list_widget.currentRow()
-        if row < 0 or row >= len(self.playlist):
+        rows = self.selected_rows()
+        if not rows:
             QMessageBox.information(self, 'Удаление', 'Выберите трек для удаления.')
             return
+        self.remove_rows(rows)
+
+    def remove_missing(self):
+        """Убирает из плейлиста треки, файлов которых больше нет. Файлы проверяются в фоне."""
+        self.metadata_service.find_missing(self.tracks.paths(self.playlist))
+
+    def missing_files_found(self, paths):
+        # Пока шла проверка, плейлист мог измениться: строки ищутся заново
+        rows = [self.playlist_model.row_of(self.tracks.find(path)) for path in paths]
+        removed = self.remove_rows([row for row in rows if row is not None])
+        QMessageBox.information(self, 'Удаление', f'Удалено отсутствующих файлов: {removed}')
+
+    def remove_duplicates(self):
+        """Убирает повторные записи одного и того же файла (например, через ссылку)."""
+        seen = set()
+        rows = []
+        for row, track_id in enumerate(self.playlist):
+            key = os.path.normcase(os.path.realpath(self.tracks.path(track_id)))
+            if key in seen:
+                rows.append(row)
+            else:
+                seen.add(key)
+        removed = self.remove_rows(rows)
+        QMessageBox.information(self, 'Удаление', f'Удалено дубликатов: {removed}')
 
-        file_path = self.playlist[row]
-        deleting_current = (row == self.current_index)
-
-        self.playlist.pop(row)
-        self.list_widget.takeItem(row)
-
-        if file_path in self.lyrics_cache:
-            del self.lyrics_cache[file_path]
+    def remove_rows(self, rows, play=True):
+        """
+        Удаляет строки плейлиста одной операцией и сохраняет текущий трек.
+        Если удалён и он, текущим становится трек, вставший на его место: он играет,
+        а при play=False — только если плеер уже играл. Возвращает число удалённых.
+        """
+        rows = sorted({row for row in rows if 0 <= row < len(self.playlist)})
+        if not rows:
+            return 0
+        removed_before = bisect.bisect_left(rows, self.current_index)
+        deleting_current = (removed_before < len(rows) and rows[removed_before] == self.current_index)
+
+        removed = self.playlist_model.remove_rows(rows)
+        self.journal.remove(self.tracks.paths(removed))
+        self.shuffle.remove(removed)
+        # Строки удалённых треков прокси убирает сам, повторять запрос не нужно
+        self.search_index.remove_many(removed)
+        for track_id in removed:
+            self.track_cache.discard(track_id)
 
         if not self.playlist:
             self.player.stop()
             self.current_index = -1
             self.set_default_cover()
-            return
+            return len(removed)
 
+        if self.current_index >= 0:
+            self.current_index -= removed_before
         if deleting_current:
-            self.current_index = min(row, len(self.playlist) - 1)
-            self.play_file(self.playlist[self.current_index])
-
-    def play_file(self, file_path):
+            self.current_index = min(self.current_index, len(self.playlist) - 1)
+            playing = self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState
+            self.play_file(self.path_at(self.current_index), play=play or playing)
+        else:
+            self.highlight_current()
+            self.preload_timer.start()
+        return len(removed)
+
+    def move_rows(self, rows, before_row):
+        """Переносит строки (например, перетаскиванием) и оставляет их выделенными."""
+        rows = sorted({row for row in rows if 0 <= row < len(self.playlist)})
+        if not rows:
+            return
+        current = self.playlist[self.current_index] if self.current_index >= 0 else None
+        moved = [self.playlist[row] for row in rows]
+        before = self.playlist_model.move_rows(rows, before_row)
+        self.journal.move(self.tracks.paths(moved),
+                          None if before is None else self.tracks.path(before))
+        if current is not None:
+            self.current_index = self.playlist_model.row_of(current)
+
+        selection = self.playlist_view.selectionModel()
+        first = self.playlist_model.row_of(moved[0])
+        top = self.playlist_proxy.mapFromSource(self.playlist_model.index(first, 0))
+        bottom = self.playlist_proxy.mapFromSource(
+            self.playlist_model.index(first + len(moved) - 1, 0))
+        if top.isValid() and bottom.isValid():
+            selection.select(QItemSelection(top, bottom),
+                             QItemSelectionModel.SelectionFlag.ClearAndSelect
+                             | QItemSelectionModel.SelectionFlag.Rows)
+        self.preload_timer.start()
+
+    def play_file(self, file_path, play=True):
+        """Переключает на трек; при play=False он только выбирается, а плеер останавливается."""
         if not file_path:
             return
-        url = QUrl.fromLocalFile(file_path)
-        self.player.setSource(url)
-        self.player.play()
-        self.update_cover(file_path)
-        self.update_lyrics(file_path)
+        # Переключение заканчивается, когда показаны обложка и текст трека
+        tracer.begin(TRACK_SWITCH, path=file_path)
+        if not play:
+            # Пустой источник: кнопка воспроизведения начнёт выбранный трек
+            self.stop()
+            self.player.setSource(QUrl())
+        elif file_path == self._preloaded and self._fade_out is None:
+            self._switch_to_next_player()
+        else:
+            url = QUrl.fromLocalFile(file_path)
+            with tracer.span('setSource', path=file_path):
+                self.player.setSource(url)
+                self.player.play()
+        self._preloaded = None
+        self.shuffle.played(self.tracks.find(file_path))
+
+        # Если трек есть в кэше (например, после предзагрузки), он покажется сразу,
+        # иначе обложка и текст подгрузятся, когда фоновый разбор закончится
+        self.set_default_cover()
+        self.title_label.setText(os.path.basename(file_path))
+        self.request_track_info(file_path)
+        self._waveform_path = file_path
+        self.position_slider.set_peaks(None)
+        self.waveforms.request(file_path, version=self.file_version(file_path))
+        self._upcoming_ticket = 0
+
         self.highlight_current()
+        self.preload_timer.start()
+
+    def _connect_player(self, player):
+        player.positionChanged.connect(self.position_changed)
+        player.durationChanged.connect(self.duration_changed)
+        player.playbackStateChanged.connect(self.update_play_button)
+        player.mediaStatusChanged.connect(self.media_status_changed)
+
+    def _disconnect_player(self, player):
+        player.positionChanged.disconnect(self.position_changed)
+        player.durationChanged.disconnect(self.duration_changed)
+        player.playbackStateChanged.disconnect(self.update_play_button)
+        player.mediaStatusChanged.disconnect(self.media_status_changed)
+
+    def preload_next(self):
+        """Открывает во втором плеере трек, который будет следующим."""
+        if self._fade_out is not None or not self.playlist or self.player.source().isEmpty():
+            return
+        index = self._next_index()
+        if index is None:
+            # Следующего трека больше нет (например, выключили повтор): прежняя
+            # предзагрузка не должна запустить переход
+            if self._preloaded is not None:
+                self.next_player.setSource(QUrl())
+                self._preloaded = None
+            return
+        file_path = self.path_at(index)
+        if file_path == self._preloaded:
+            return
+        self.next_player.setSource(QUrl.fromLocalFile(file_path))
+        self._preloaded = file_path
+
+        meta = self.cached_metadata(file_path)
+        if meta is None or (meta[4] is not None and self.cover_pixmap(meta[4]) is None):
+            self._upcoming_ticket = self.metadata_service.request(file_path)
+        self.waveforms.request(file_path, background=True, version=self.file_version(file_path))
+
+    def waveform_ready(self, file_path, peaks):
+        if file_path == self._waveform_path:
+            self.position_slider.set_peaks(peaks)
+
+    def _switch_to_next_player(self):
+        old_player, old_output = self.player, self.audio_output
+        self._disconnect_player(old_player)
+        self.player, self.next_player = self.next_player, old_player
+        self.audio_output, self.next_audio_output = self.next_audio_output, old_output
+        self._connect_player(self.player)
+
+        volume = self.volume_slider.value() / 100.0
+        crossfade = self.crossfade_spin.value() * 1000
+        if crossfade and old_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            # Старый трек доигрывает, затухая, пока новый нарастает
+            self._fade_out = (old_player, old_output, time.monotonic(), crossfade)
+            self.audio_output.setVolume(0)
+            self.fade_timer.start()
+        else:
+            old_player.stop()
+            self.audio_output.setVolume(volume)
+        self.player.play()
+
+        # Новый источник уже загружен, сигналы об этом не повторятся
+        self.duration_changed(self.player.duration())
+        self.position_changed(self.player.position())
+
+    def _fade_step(self):
+        old_player, old_output, started, crossfade = self._fade_out
+        progress = min(1.0, (time.monotonic() - started) * 1000 / crossfade)
+        volume = self.volume_slider.value() / 100.0
+        self.audio_output.setVolume(volume * progress)
+        old_output.setVolume(volume * (1.0 - progress))
+        if progress >= 1.0:
+            self.fade_timer.stop()
+            old_player.stop()
+            self._fade_out = None
+            self.preload_next()
 
     def play_pause(self):
         if not self.playlist:
@@ -431,12 +2449,17 @@ class PyTune(QWidget):
         else:
             if self.player.source().isEmpty():
                 self.current_index = max(self.current_index, 0)
-                self.play_file(self.playlist[self.current_index])
+                self.play_file(self.path_at(self.current_index))
             else:
                 self.player.play()
 
     def stop(self):
         self.player.stop()
+        if self._fade_out is not None:
+            self.fade_timer.stop()
+            self._fade_out[0].stop()
+            self._fade_out = None
+            self.audio_output.setVolume(self.volume_slider.value() / 100.0)
 
     def prev_track(self):
         if not self.playlist:
@@ -447,45 +2470,63 @@ class PyTune(QWidget):
             return
 
         if self.shuffle_mode:
-            self.current_index = random.randrange(len(self.playlist))
-            self.play_file(self.playlist[self.current_index])
+            track_id = self.shuffle.back()
+            if track_id is None:
+                self.player.setPosition(0)
+                return
+            self.current_index = self.playlist_model.row_of(track_id)
+            self.play_file(self.tracks.path(track_id))
             return
 
         self.current_index = (self.current_index - 1) % len(self.playlist)
-        self.play_file(self.playlist[self.current_index])
+        self.play_file(self.path_at(self.current_index))
 
     def next_track(self):
         if not self.playlist:
             return
 
-        if self.shuffle_mode:
-            new_index = random.randrange(len(self.playlist))
-            if len(self.playlist) > 1:
-                while new_index == self.current_index:
-                    new_index = random.randrange(len(self.playlist))
-            self.current_index = new_index
-            self.play_file(self.playlist[self.current_index])
+        index = self._next_index()
+        if index is None:
+            self.stop()
+            self.current_index = len(self.playlist) - 1
             return
 
-        if self.repeat_mode == 1:
-            self.play_file(self.playlist[self.current_index])
-            return
+        if self.shuffle_mode:
+            # Трек уже выбран в _next_index, теперь он становится текущим
+            self.shuffle.advance()
+        self.current_index = index
+        self.play_file(self.path_at(self.current_index))
 
-        self.current_index += 1
+    def _next_index(self):
+        """
+        Индекс трека, который пойдёт после текущего, или None, если пора остановиться.
+        В режиме shuffle следующий трек выбран заранее, поэтому предзагрузка и переход совпадают.
+        """
+        if self.shuffle_mode:
+            return self.playlist_model.row_of(self.shuffle.peek())
 
-        if self.repeat_mode == 0 and self.current_index >= len(self.playlist):
-            self.stop()
-            self.current_index = len(self.playlist) - 1
-            return
+        if self.repeat_mode == 1 and 0 <= self.current_index < len(self.playlist):
+            return self.current_index
+
+        index = self.current_index + 1
+        if self.repeat_mode == 0 and index >= len(self.playlist):
+            return None
+        return index % len(self.playlist)
 
-        self.current_index %= len(self.playlist)
-        self.play_file(self.playlist[self.current_index])
+    def path_at(self, row):
+        """Путь трека в строке плейлиста."""
+        return self.tracks.path(self.playlist[row])
 
-    def list_double_clicked(self, item):
-        row = self.list_widget.currentRow()
+    def selected_rows(self):
+        """Строки плейлиста (без учёта фильтра), выделенные в таблице."""
+        indexes = self.playlist_view.selectionModel().selectedRows()
+        return sorted(self.playlist_proxy.mapToSource(index).row() for index in indexes)
+
+    def list_double_clicked(self, index):
+        row = self.playlist_proxy.mapToSource(index).row()
         if 0 <= row < len(self.playlist):
             self.current_index = row
-            self.play_file(self.playlist[self.current_index])
+            self.play_file(self.path_at(self.current_index))
 
     def seek(self, position):
         self.player.setPosition(position)
@@ -494,65 +2535,118 @@ class PyTune(QWidget):
         self.audio_output.setVolume(value / 100.0)
 
     def position_changed(self, pos):
-        self.position_slider.setValue(pos)
+        self.refresh.schedule(self.refresh_position)
+
+        # С переходом следующий трек стартует раньше конца текущего
+        crossfade = self.crossfade_spin.value() * 1000
+        duration = self.player.duration()
+        if (crossfade and self._preloaded and self._fade_out is None
+                and duration > 2 * crossfade and duration - pos <= crossfade):
+            # Режим могли сменить после предзагрузки: переход только к тому треку,
+            # который действительно следующий
+            index = self._next_index()
+            if index is not None and self.path_at(index) == self._preloaded:
+                self.next_track()
 
     def duration_changed(self, dur):
         self.position_slider.setRange(0, dur)
-
-    def update_time_label(self):
-        pos = int(self.player.position() / 1000)
-        dur = int(self.player.duration() / 1000)
-        fmt = lambda s: f"{s//60:02d}:{s%60:02d}"
-        self.time_label.setText(f"{fmt(pos)} / {fmt(dur)}")
+        self.refresh.schedule(self.refresh_position)
+
+    def refresh_position(self):
+        """Кадр обновления: полоса прокрутки, время и строка текста песни."""
+        pos = self.player.position()
+        if not self.position_slider.isSliderDown():
+            self.position_slider.setValue(pos)
+        self.lyrics_text.set_position(pos)
+        text = f"{format_time(pos // 1000)} / {format_time(self.player.duration() // 1000)}"
+        if text != self._time_text:
+            self._time_text = text
+            self.time_label.setText(text)
 
     def update_play_button(self, state):
         self.play_btn.setText('⏸' if state == QMediaPlayer.PlaybackState.PlayingState else '▶')
 
     def highlight_current(self):
-        if 0 <= self.current_index < self.list_widget.count():
-            self.list_widget.setCurrentRow(self.current_index)
+        if 0 <= self.current_index < len(self.playlist):
+            source_index = self.playlist_model.index(self.current_index, 0)
+            index = self.playlist_proxy.mapFromSource(source_index)
+            if index.isValid():
+                self.playlist_view.setCurrentIndex(index)
 
     def media_status_changed(self, status):
         if status == QMediaPlayer.MediaStatus.EndOfMedia:
             self.next_track()
 
     def save_playlist(self):
-        data = {"playlist": self.playlist, "current_index": self.current_index}
-        try:
-            with open("playlist.json", "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-        except:
-            pass
-
-    def load_playlist(self):
-        if not os.path.exists("playlist.json"):
+        if self._restore_pending:
+            # Окно закрыли раньше, чем успели восстановить сессию: не затираем её
             return
+        # Сам плейлист попадает в журнал по мере изменений, остаётся только позиция
+        self.journal.set_state("current_index", self.current_index)
+        self.journal.set_state("crossfade", self.crossfade_spin.value())
+        self.journal.set_state("imported_folders", self.imported_folders)
+        self.journal.set_state("watch_folders", self.watch_action.isChecked())
 
-        try:
-            with open("playlist.json", "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            self.playlist = data.get("playlist", [])
-            self.current_index = data.get("current_index", -1)
-
-            self.list_widget.clear()
-            for track in self.playlist:
-                self.list_widget.addItem(track)
+    def autosave(self):
+        self.save_playlist()
+        # Пока идёт прошлая запись, новые операции подождут следующего тика
+        if self.journal.pending() and self._journal_pool.activeThreadCount() == 0:
+            self._journal_pool.start(self._journal_task)
 
-            if self.playlist and 0 <= self.current_index < len(self.playlist):
-                self.highlight_current()
-                self.update_cover(self.playlist[self.current_index])
-        except:
-            pass
+    def load_playlist(self):
+        # Плейлист от старых версий лежал в playlist.json рядом с программой
+        self.library.import_playlist_json("playlist.json")
+
+        self.playlist = self.tracks.add_many(self.library.load_playlist())
+        self.current_index = self.library.get_state("current_index", -1)
+
+        self.playlist_model.set_ids(self.playlist)
+        self.shuffle.reset(self.playlist)
+        self.crossfade_spin.setValue(self.library.get_state("crossfade", 0))
+        self.imported_folders = self.library.get_state("imported_folders", [])
+        self.watch_action.setChecked(self.library.get_state("watch_folders", True))
+        self.set_watching(self.watch_action.isChecked())
+
+        if self.playlist and 0 <= self.current_index < len(self.playlist):
+            self.highlight_current()
+            self.shuffle.played(self.playlist[self.current_index])
+            self.request_track_info(self.path_at(self.current_index))
+        else:
+            self.current_index = -1
 
     def closeEvent(self, event):
+        # Таймеры обращаются к библиотеке, которая ниже закрывается
+        self.autosave_timer.stop()
+        self.preload_timer.stop()
+        self.tag_write_timer.stop()
         self.save_playlist()
+        self.folder_importer.shutdown()
+        self.watcher.shutdown()
+        self.metadata_service.shutdown()
+        self.waveforms.shutdown()
+        self._journal_pool.waitForDone()
+        self.journal.close()
+        self.flush_tag_writes()
+        self.library.close()
         event.accept()
 
 
 if __name__ == '__main__':
+    startup_mark("imports")
     app = QApplication(sys.argv)
+    app.setApplicationName('PyTune')
+    server = None
+    if not _LAUNCH['new_instance']:
+        server = instance.InstanceServer(app)
+        # Другой экземпляр мог успеть запуститься одновременно с этим
+        if not server.listen() and instance.forward(_LAUNCH):
+            sys.exit(0)
     player = PyTune()
+    startup_mark("window created")
+    if server is not None:
+        server.message_received.connect(player.handle_message)
+    if _LAUNCH['files'] or _LAUNCH['command']:
+        player.handle_message(_LAUNCH)
     player.show()
     sys.exit(app.exec())
 
@@ -0,0 +1,456 @@
+import os
+import gc
+import sys
+import json
+import time
+import wave
+import random
+import shutil
+import struct
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+
+# Замеры идут без окна на экране; задать платформу нужно до импорта Qt
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import mutagen
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, USLT, APIC
+from mutagen.wave import WAVE
+from mutagen.flac import FLAC, Picture
+from mutagen.oggvorbis import OggVorbis
+from mutagen.oggopus import OggOpus
+from mutagen.ogg import OggPage
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.asf import ASF, ASFByteArrayAttribute
+from PyQt6.QtCore import QBuffer, QIODevice, PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt6.QtGui import QImage
+from PyQt6.QtWidgets import QApplication
+
+from library import LibraryStore
+from lyrics import parse_lrc
+from search import SearchIndex
+from tags import read_tags
+
+
+FORMATS = ('mp3', 'wav', 'flac', 'ogg', 'opus', 'm4a', 'wma')
+# Вариант файла -> (большая обложка, длинный синхронный текст)
+VARIANTS = {'plain': (False, False), 'rich': (True, True)}
+SCALES = (1000, 10000, 100000)
+COVER_PIXELS = 1200
+LYRICS_LINES = 300
+SWITCHES = 50
+# Запросы в порядке набора: каждый следующий уточняет предыдущий
+TYPING = ('s', 'so', 'son', 'song', 'song 4', 'song 42', 'artist 12 song', 'nomatch')
+
+
+# --- синтетические файлы ---
+
+def _write_mp3(path, seconds=1):
+    # Кадры MPEG-1 Layer III 128 кбит/с, 44,1 кГц по 417 байт с тишиной
+    frame = b'\xff\xfb\x90\x00' + bytes(413)
+    with open(path, 'wb') as f:
+        f.write(frame * (seconds * 44100 // 1152))
+
+
+def _write_wav(path, seconds=1):
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(bytes(seconds * 8000 * 2))
+
+
+def _write_flac(path, seconds=1):
+    # Только блок STREAMINFO: размеры блоков, частота, 2 канала, 16 бит, число отсчётов, MD5
+    rate = 44100
+    info = struct.pack('>HH', 4096, 4096) + bytes(6)
+    info += ((rate << 44) | (1 << 41) | (15 << 36) | rate * seconds).to_bytes(8, 'big')
+    info += bytes(16)
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80, 0, 0, len(info)]) + info)
+
+
+def _write_ogg(path, opus, seconds=1):
+    if opus:
+        rate = 48000
+        packets = [[b'OpusHead' + struct.pack('<BBHIhB', 1, 2, 312, rate, 0, 0)],
+                   [b'OpusTags' + struct.pack('<I', 6) + b'PyTune' + struct.pack('<I', 0)]]
+    else:
+        rate = 44100
+        packets = [[b'\x01vorbis' + struct.pack('<IBIiiiBB', 0, 2, rate, 0, 128000, 0, 0xb8, 1)],
+                   [b'\x03vorbis' + struct.pack('<I', 6) + b'PyTune' + struct.pack('<I', 0) + b'\x01',
+                    b'\x05vorbis' + bytes(32)]]
+    packets.append([bytes(64)])
+    with open(path, 'wb') as f:
+        for sequence, page_packets in enumerate(packets):
+            page = OggPage()
+            page.serial = 0x50795475
+            page.sequence = sequence
+            page.packets = page_packets
+            page.first = sequence == 0
+            page.last = sequence == len(packets) - 1
+            page.position = rate * seconds if page.last else 0
+            f.write(page.write())
+
+
+def _mp4_atom(name, payload):
+    return struct.pack('>I', 8 + len(payload)) + name + payload
+
+
+def _write_m4a(path, seconds=1):
+    # Дорожка со звуком: mvhd, mdhd с длительностью и hdlr типа soun
+    rate = 44100
+    mvhd = _mp4_atom(b'mvhd', struct.pack('>IIIII', 0, 0, 0, rate, rate * seconds) + bytes(80))
+    mdhd = _mp4_atom(b'mdhd', struct.pack('>IIIIIHH', 0, 0, 0, rate, rate * seconds, 0, 0))
+    hdlr = _mp4_atom(b'hdlr', struct.pack('>II', 0, 0) + b'soun' + bytes(13))
+    trak = _mp4_atom(b'trak', _mp4_atom(b'mdia', mdhd + hdlr))
+    with open(path, 'wb') as f:
+        f.write(_mp4_atom(b'ftyp', b'M4A \x00\x00\x02\x00M4A mp42isom'))
+        f.write(_mp4_atom(b'moov', mvhd + trak))
+        f.write(_mp4_atom(b'mdat', bytes(64)))
+
+
+def _asf_object(guid, payload):
+    return guid + struct.pack('<Q', 24 + len(payload)) + payload
+
+
+def _write_wma(path, seconds=1):
+    # Заголовок ASF со свойствами файла (длительность) и потока (WAVEFORMATEX)
+    from mutagen.asf._objects import HeaderObject, FilePropertiesObject, StreamPropertiesObject
+    file_props = bytes(40) + struct.pack('<QQQ', seconds * 10 ** 7, seconds * 10 ** 7, 0) + bytes(16)
+    stream_props = bytes(40) + struct.pack('<IIHI', 18, 0, 1, 0)
+    stream_props += struct.pack('<HHIIHHH', 0x161, 2, 44100, 16000, 2, 16, 0)
+    objects = (_asf_object(FilePropertiesObject.GUID, file_props)
+               + _asf_object(StreamPropertiesObject.GUID, stream_props))
+    header = HeaderObject.GUID + struct.pack('<QIBB', 30 + len(objects), 2, 1, 2) + objects
+    with open(path, 'wb') as f:
+        f.write(header)
+
+
+def _write_silence(path, fmt):
+    if fmt in ('ogg', 'opus'):
+        _write_ogg(path, fmt == 'opus')
+    else:
+        globals()['_write_' + fmt](path)
+
+
+def _asf_picture(cover):
+    # WM/Picture: тип, размер, MIME и пустое описание в UTF-16 с нулём, затем картинка
+    return (struct.pack('<BI', 3, len(cover)) + 'image/jpeg\0'.encode('utf-16-le')
+            + '\0'.encode('utf-16-le') + cover)
+
+
+def _write_tags(path, fmt, title, artist, album, lyrics, cover):
+    if fmt in ('mp3', 'wav'):
+        if fmt == 'wav':
+            audio = WAVE(path)
+            audio.add_tags()
+            tags = audio.tags
+        else:
+            tags = ID3()
+        tags.add(TIT2(encoding=3, text=title))
+        tags.add(TPE1(encoding=3, text=artist))
+        tags.add(TALB(encoding=3, text=album))
+        if lyrics:
+            tags.add(USLT(encoding=3, lang='eng', desc='', text=lyrics))
+        if cover:
+            tags.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover))
+        if fmt == 'wav':
+            audio.save()
+        else:
+            tags.save(path)
+        return
+
+    if fmt == 'm4a':
+        audio = MP4(path)
+        audio.add_tags()
+        audio['\xa9nam'], audio['\xa9ART'], audio['\xa9alb'] = [title], [artist], [album]
+        if lyrics:
+            audio['\xa9lyr'] = [lyrics]
+        if cover:
+            audio['covr'] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_JPEG)]
+    elif fmt == 'wma':
+        audio = ASF(path)
+        audio['Title'], audio['Author'], audio['WM/AlbumTitle'] = [title], [artist], [album]
+        if lyrics:
+            audio['WM/Lyrics'] = [lyrics]
+        if cover:
+            audio['WM/Picture'] = [ASFByteArrayAttribute(_asf_picture(cover))]
+    else:
+        audio = {'flac': FLAC, 'ogg': OggVorbis, 'opus': OggOpus}[fmt](path)
+        audio['title'], audio['artist'], audio['album'] = [title], [artist], [album]
+        if lyrics:
+            audio['lyrics'] = [lyrics]
+        if cover and fmt == 'flac':
+            picture = Picture()
+            picture.type = 3
+            picture.mime = 'image/jpeg'
+            picture.data = cover
+            audio.add_picture(picture)
+    audio.save()
+
+
+def make_cover(pixels=COVER_PIXELS):
+    """Большая обложка: JPEG из шума почти не сжимается и долго декодируется."""
+    data = os.urandom(pixels * pixels * 3)
+    image = QImage(data, pixels, pixels, pixels * 3, QImage.Format.Format_RGB888)
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, 'JPG', 95)
+    return bytes(buffer.data())
+
+
+def make_lyrics(lines=LYRICS_LINES):
+    """Синхронный текст в формате LRC: строка каждые три секунды."""
+    return '\n'.join(f'[{i * 3 // 60:02d}:{i * 3 % 60:02d}.00]Строка текста номер {i}, '
+                     f'достаточно длинная, чтобы походить на настоящую'
+                     for i in range(lines))
+
+
+def make_fixtures(folder):
+    """Файл каждого формата в каждом варианте; возвращает {(формат, вариант): путь}."""
+    os.makedirs(folder, exist_ok=True)
+    cover, lyrics = make_cover(), make_lyrics()
+    fixtures = {}
+    for fmt in FORMATS:
+        for variant, (with_cover, with_lyrics) in VARIANTS.items():
+            path = os.path.join(folder, f'{variant}.{fmt}')
+            _write_silence(path, fmt)
+            _write_tags(path, fmt, f'Song {variant}', 'Artist', 'Album',
+                        lyrics if with_lyrics else None, cover if with_cover else None)
+            fixtures[fmt, variant] = path
+    return fixtures
+
+
+def make_library(folder, template, count):
+    """
+    count файлов в каталогах «исполнитель/альбом» — жёсткие ссылки на template,
+    чтобы большие библиотеки не занимали место. Возвращает пути.
+    """
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f'Artist {i % 500:03d}', f'Album {i % 37:02d}',
+                            f'{i:06d} - Song {i}.mp3')
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(template, path)
+            except OSError:
+                shutil.copyfile(template, path)
+        paths.append(path)
+    return paths
+
+
+# --- замеры ---
+
+def measure(func, repeat, setup=None, per=1):
+    """
+    Время func (медиана и минимум из repeat запусков, в мс на одну из per операций)
+    и пик выделенной Python-памяти за отдельный запуск под tracemalloc.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000 / per)
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'median_ms': round(statistics.median(times), 6),
+            'min_ms': round(min(times), 6),
+            'peak_kb': peak // 1024}
+
+
+def bench_files(fixtures, repeat):
+    """Разбор тегов для строк плейлиста и полный разбор при переключении на новый трек."""
+    from PyTune import make_thumbnail
+    results = {}
+    for (fmt, variant), path in fixtures.items():
+        results[f'tags.{fmt}.{variant}.list'] = measure(
+            lambda: read_tags(path, with_cover=False), repeat)
+
+        def switch():
+            info = read_tags(path)
+            if info.cover:
+                make_thumbnail(info.cover)
+            parse_lrc(info.lyrics)
+        results[f'tags.{fmt}.{variant}.switch'] = measure(switch, repeat)
+
+    lyrics = make_lyrics()
+    synced = parse_lrc(lyrics)
+    results['lyrics.parse'] = measure(lambda: parse_lrc(lyrics), repeat)
+    positions = range(0, LYRICS_LINES * 3000, 100)
+    results['lyrics.line_at'] = measure(
+        lambda: [synced.line_at(ms) for ms in positions], repeat, per=len(positions))
+    return results
+
+
+def bench_scale(app, workdir, template, count, repeat):
+    """Запуск, загрузка плейлиста, поиск, добавление с дублями и переключение треков."""
+    import PyTune as pytune
+    data_dir = os.path.join(workdir, f'data-{count}')
+    shutil.rmtree(data_dir, ignore_errors=True)
+    # Библиотека и кэши плеера на время замера лежат во временном каталоге
+    pytune._data_dir = lambda: data_dir
+    pytune._cache_dir = lambda: os.path.join(data_dir, 'cache')
+
+    paths = make_library(os.path.join(workdir, 'library'), template, count + count // 10)
+    paths, new_paths = paths[:count], paths[count:]
+    stat = os.stat(template)
+    store = LibraryStore(os.path.join(data_dir, 'library.db'))
+    store.append_tracks(paths)
+    store.store_many((path, stat, f'Song {i}', f'Artist {i % 500}', 1.0, None, None)
+                     for i, path in enumerate(paths + new_paths))
+    store.set_state('current_index', 0)
+    store.close()
+
+    results = {}
+    windows = []
+
+    def close_windows():
+        while windows:
+            window = windows.pop()
+            window.close()
+            window.deleteLater()
+        app.processEvents()
+
+    def startup():
+        window = pytune.PyTune()
+        window.load_playlist()
+        windows.append(window)
+    results[f'playlist.{count}.startup'] = measure(startup, repeat, setup=close_windows)
+    close_windows()
+
+    window = pytune.PyTune()
+    results[f'playlist.{count}.load'] = measure(window.load_playlist, repeat)
+
+    def reset_search():
+        window.search_index = SearchIndex()
+        window._search_index_built = False
+    results[f'search.{count}.index'] = measure(window.build_search_index, repeat, setup=reset_search)
+
+    def typing():
+        for query in TYPING:
+            window.search_bar.setText(query)
+            window.filter_list()
+        window.search_bar.setText('')
+        window.filter_list()
+    results[f'search.{count}.typing'] = measure(typing, repeat, per=len(TYPING) + 1)
+
+    batch = paths[::2] + new_paths
+    results[f'dedupe.{count}.add'] = measure(lambda: window.add_tracks(batch), repeat,
+                                             setup=window.load_playlist)
+
+    window.load_playlist()
+    targets = random.Random(count).sample(paths, min(SWITCHES, len(paths)))
+    results[f'switch.{count}.warm'] = measure(
+        lambda: [window.play_file(path) for path in targets], repeat, per=len(targets))
+    window.stop()
+    windows.append(window)
+    close_windows()
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Замеры, которые стали медленнее базовых больше чем на tolerance (и на min_delta_ms)."""
+    regressions = []
+    for key, entry in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        old, new = base['median_ms'], entry['median_ms']
+        if new > old * (1 + tolerance) and new - old > min_delta_ms:
+            regressions.append((key, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='benchmark',
+        description='Замеры горячих путей PyTune на синтетических файлах и библиотеках.')
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)),
+                        help='размеры библиотек через запятую (по умолчанию %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='повторов каждого замера')
+    parser.add_argument('--workdir', help='каталог для файлов (по умолчанию временный, удаляется)')
+    parser.add_argument('-o', '--output', help='куда записать результаты в JSON (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON прошлого прогона: замедления завершают прогон с кодом 1')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='допустимое замедление относительно базы (по умолчанию %(default)s)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='меньшие разницы считаются шумом (по умолчанию %(default)s)')
+    args = parser.parse_args(argv)
+    scales = [int(value) for value in args.scales.split(',') if value.strip()]
+    repeat = max(1, args.repeat)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pytune-bench-')
+    # Плеер ищет playlist.json старых версий в текущем каталоге
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = {}
+    try:
+        fixtures = make_fixtures(os.path.join(workdir, 'fixtures'))
+        results.update(bench_files(fixtures, repeat))
+        for count in scales:
+            print(f'Библиотека на {count} треков...', file=sys.stderr)
+            results.update(bench_scale(app, workdir, fixtures['mp3', 'plain'], count, repeat))
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'qt': QT_VERSION_STR,
+            'pyqt': PYQT_VERSION_STR,
+            'mutagen': mutagen.version_string,
+            'repeat': repeat,
+            'scales': scales,
+        },
+        'results': results,
+    }
+    try:
+        import resource
+        # ru_maxrss в килобайтах на Linux и в байтах на macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['meta']['max_rss_kb'] = maxrss // 1024 if sys.platform == 'darwin' else maxrss
+    except ImportError:  # Windows
+        pass
+
+    for key, entry in results.items():
+        print(f'{key:32} {entry["median_ms"]:11.4f} мс {entry["peak_kb"]:10d} КБ', file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for key, old, new in regressions:
+            print(f'Замедление {key}: {old:.3f} -> {new:.3f} мс', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Кэш с вытеснением давно не использованных записей.
+
+    Ограничивается числом записей и, если задана функция cost, суммарным
+    «весом» записей (обычно байтами). Считает попадания и промахи.
+    """
+
+    def __init__(self, max_entries=1000, max_cost=None, cost=None):
+        self.max_entries = max_entries
+        self.max_cost = max_cost
+        self._cost = cost
+        self._data = OrderedDict()  # ключ -> (значение, вес)
+        self.total_cost = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        weight = self._cost(value) if self._cost else 0
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.total_cost -= old[1]
+        if self.max_cost is not None and weight > self.max_cost:
+            return
+        self._data[key] = (value, weight)
+        self.total_cost += weight
+        self._evict()
+
+    def discard(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.total_cost -= entry[1]
+
+    def clear(self):
+        self._data.clear()
+        self.total_cost = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "cost": self.total_cost,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _evict(self):
+        while len(self._data) > self.max_entries or (
+                self.max_cost is not None and self.total_cost > self.max_cost):
+            _, (_, weight) = self._data.popitem(last=False)
+            self.total_cost -= weight
+
+
+class ThumbnailCache:
+    """
+    Уменьшенные обложки на диске: один файл на хэш содержимого обложки.
+    С другим suffix годится и для других небольших производных данных
+    (например, пиков волновой формы).
+
+    Общий размер ограничен; при переполнении удаляются файлы, которые дольше
+    всего не читались. Методы можно вызывать из нескольких потоков.
+    """
+    SUFFIX = '.thumb'
+
+    def __init__(self, folder, max_bytes=128 * 1024 * 1024, suffix=SUFFIX):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._total = None
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # Время изменения служит отметкой последнего использования
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def locate(self, key):
+        """Путь к файлу записи, чтобы открыть его самому (например, через mmap), или None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, data):
+        path = self._path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Не удалось сохранить миниатюру {path}: {e}")
+            return
+
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # Удаляем самые давние, оставляя запас в 10%, чтобы не чистить на каждой записи
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total = total
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from library import LibraryStore, scan_audio_files
+from tags import read_tags
+
+
+# Столько файлов разбирает процесс за одно задание: меньше пересылок между процессами
+CHUNK_SIZE = 64
+# Сколько заданий на процесс держится в работе, пока идёт обход каталогов
+JOBS_IN_FLIGHT = 2
+
+
+def default_db_path():
+    """Библиотека плеера: тот же файл, который открывает PyTune.py."""
+    from PyQt6.QtCore import QCoreApplication, QStandardPaths
+    QCoreApplication.setApplicationName('PyTune')
+    folder = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation)
+    return os.path.join(folder or os.getcwd(), 'library.db')
+
+
+def index_chunk(paths):
+    """
+    Разбирает пачку файлов в процессе пула и возвращает записи для
+    LibraryStore.store_many. Обложки не читаются: плеер дочитает обложку
+    при первом воспроизведении трека.
+    """
+    records = []
+    for path in paths:
+        try:
+            # stat до разбора: запись должна соответствовать прочитанной версии
+            stat = os.stat(path)
+        except OSError:
+            continue
+        info = read_tags(path, with_cover=False)
+        records.append((path, stat, info.title, info.artist, info.duration,
+                        info.lyrics, info.cover_hash))
+    return records
+
+
+def _changed(store, paths, force):
+    """Пути, которых нет в библиотеке или которые изменились после разбора."""
+    known = {} if force else store.versions(paths)
+    changed = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if known.get(path) != (stat.st_size, stat.st_mtime):
+            changed.append(path)
+    return changed
+
+
+def _chunks(folders, chunk_size):
+    chunk = []
+    for folder in folders:
+        for path in scan_audio_files(folder):
+            chunk.append(path)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _drain(store, pending, limit):
+    """Ждёт, пока в работе останется меньше limit заданий, и записывает их результаты."""
+    stored = 0
+    while len(pending) >= limit:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            records = future.result()
+            store.store_many(records)
+            stored += len(records)
+    return stored
+
+
+def index_folders(store, folders, jobs=None, chunk_size=CHUNK_SIZE, force=False, progress=None):
+    """
+    Разбирает теги новых и изменённых аудиофайлов в каталогах пулом процессов
+    и записывает их в библиотеку. Обход каталогов идёт одновременно с разбором.
+    progress(indexed, skipped) вызывается после каждой пачки.
+    Возвращает (число разобранных файлов, число файлов без изменений).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    indexed = skipped = 0
+    pending = set()
+    executor = ProcessPoolExecutor(jobs)
+    try:
+        for chunk in _chunks(folders, chunk_size):
+            changed = _changed(store, chunk, force)
+            skipped += len(chunk) - len(changed)
+            if changed:
+                pending.add(executor.submit(index_chunk, changed))
+            indexed += _drain(store, pending, jobs * JOBS_IN_FLIGHT)
+            if progress is not None:
+                progress(indexed, skipped)
+        indexed += _drain(store, pending, 1)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+    return indexed, skipped
+
+
+def _print_progress(indexed, skipped):
+    print(f'\rРазобрано: {indexed}, без изменений: {skipped}', end='', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='indexer',
+        description='Заранее разбирает теги аудиофайлов в библиотеку PyTune, '
+                    'чтобы плеер показывал их без разбора файлов.')
+    parser.add_argument('folders', nargs='+', help='каталоги с музыкой')
+    parser.add_argument('--db', help='файл библиотеки (по умолчанию библиотека плеера)')
+    parser.add_argument('-j', '--jobs', type=int, help='число процессов (по умолчанию по числу ядер)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'файлов в одном задании (по умолчанию {CHUNK_SIZE})')
+    parser.add_argument('--force', action='store_true', help='разобрать заново и неизменённые файлы')
+    args = parser.parse_args(argv)
+
+    for folder in args.folders:
+        if not os.path.isdir(folder):
+            parser.error(f'нет такого каталога: {folder}')
+    folders = [os.path.abspath(folder) for folder in args.folders]
+
+    progress = _print_progress if sys.stderr.isatty() else None
+
+    store = LibraryStore(args.db or default_db_path())
+    started = time.perf_counter()
+    try:
+        indexed, skipped = index_folders(store, folders, args.jobs, max(1, args.chunk_size),
+                                         args.force, progress)
+    except KeyboardInterrupt:
+        print('\nПрервано: уже разобранные файлы сохранены', file=sys.stderr)
+        return 130
+    finally:
+        store.close()
+    if progress is not None:
+        print(file=sys.stderr)
+    print(f'Разобрано файлов: {indexed}, без изменений: {skipped}, '
+          f'за {time.perf_counter() - started:.1f} с')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
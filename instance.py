@@ -0,0 +1,106 @@
+import os
+import json
+import getpass
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+
+# Ключ командной строки -> команда для запущенного плеера
+COMMANDS = {
+    '--play-pause': 'play-pause',
+    '--next': 'next',
+    '--prev': 'prev',
+    '--stop': 'stop',
+}
+NEW_INSTANCE = '--new-instance'
+
+
+def server_name():
+    """Имя локального сокета: своё у каждого пользователя."""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = ''
+    return f'PyTune-{user}'
+
+
+def parse_args(args):
+    """
+    Разбирает командную строку в сообщение для плеера:
+    {'command': ..., 'files': [...], 'new_instance': bool}.
+    Пути делаются абсолютными, потому что у запущенного плеера другой рабочий каталог.
+    """
+    message = {'command': None, 'files': [], 'new_instance': False}
+    for arg in args:
+        if arg in COMMANDS:
+            message['command'] = COMMANDS[arg]
+        elif arg == NEW_INSTANCE:
+            message['new_instance'] = True
+        elif not arg.startswith('-'):
+            message['files'].append(os.path.abspath(arg))
+    return message
+
+
+def forward(message, timeout=500):
+    """
+    Передаёт сообщение уже запущенному плееру.
+    Возвращает False, если запущенного плеера нет.
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(server_name())
+    if not socket.waitForConnected(timeout):
+        return False
+    socket.write(json.dumps(message).encode('utf-8'))
+    socket.flush()
+    socket.waitForBytesWritten(timeout)
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.LocalSocketState.UnconnectedState:
+        socket.waitForDisconnected(timeout)
+    return True
+
+
+class InstanceServer(QObject):
+    """
+    Принимает сообщения от повторных запусков плеера. Каждое соединение
+    передаёт один JSON-объект и закрывается; он приходит сигналом message_received.
+    """
+    message_received = pyqtSignal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._server = QLocalServer(self)
+        self._server.newConnection.connect(self._on_new_connection)
+        self._buffers = {}
+
+    def listen(self):
+        """Начинает слушать; False, если сокет занят другим запущенным плеером."""
+        name = server_name()
+        if self._server.listen(name):
+            return True
+        # Сокет мог остаться после аварийного завершения: проверяем, жив ли владелец
+        probe = QLocalSocket()
+        probe.connectToServer(name)
+        if probe.waitForConnected(200):
+            probe.disconnectFromServer()
+            return False
+        QLocalServer.removeServer(name)
+        return self._server.listen(name)
+
+    def _on_new_connection(self):
+        while self._server.hasPendingConnections():
+            socket = self._server.nextPendingConnection()
+            self._buffers[socket] = bytearray()
+            socket.readyRead.connect(lambda s=socket: self._buffers[s].extend(bytes(s.readAll())))
+            socket.disconnected.connect(lambda s=socket: self._on_disconnected(s))
+
+    def _on_disconnected(self, socket):
+        data = self._buffers.pop(socket, bytearray())
+        data.extend(bytes(socket.readAll()))
+        socket.deleteLater()
+        try:
+            message = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return
+        if isinstance(message, dict):
+            self.message_received.emit(message)
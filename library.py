@@ -0,0 +1,410 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.opus', '.aac', '.m4a', '.wma')
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    title TEXT,
+    artist TEXT,
+    duration REAL,
+    lyrics TEXT,
+    cover_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS playlist (
+    pos INTEGER PRIMARY KEY,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS playlist_path ON playlist (path);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def list_folder(folder, extensions=AUDIO_EXTENSIONS):
+    """
+    Аудиофайлы и подкаталоги одного каталога (без обхода вглубь), и те и другие
+    по имени. Ссылки на каталоги в подкаталоги не попадают, чтобы обход не
+    зациклился. Если сам каталог не читается, исключение OSError уходит наружу.
+    """
+    with os.scandir(folder) as it:
+        entries = sorted(it, key=lambda e: e.name.casefold())
+    files = []
+    subfolders = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                files.append(entry.path)
+        except OSError:
+            continue
+    return files, subfolders
+
+
+def scan_audio_files(root, extensions=AUDIO_EXTENSIONS):
+    """
+    Рекурсивно обходит каталог через os.scandir и по одному возвращает пути
+    аудиофайлов. Внутри каталога файлы идут по имени, затем подкаталоги.
+    """
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            files, subfolders = list_folder(folder, extensions)
+        except OSError as e:
+            print(f"Не удалось прочитать каталог {folder}: {e}")
+            continue
+        yield from files
+        stack.extend(reversed(subfolders))
+
+
+def cover_hash(cover_data):
+    """Хэш содержимого обложки: одинаковые картинки альбома дают один ключ."""
+    if not cover_data:
+        return None
+    return hashlib.sha1(cover_data).hexdigest()
+
+
+class TrackRecord:
+    """
+    Закэшированные метаданные трека из библиотеки.
+    Пустой cover_hash значит, что обложка есть, но при разборе не читалась.
+    """
+    __slots__ = ('path', 'title', 'artist', 'duration', 'lyrics', 'cover_hash')
+
+    def __init__(self, path, title, artist, duration, lyrics, cover_hash):
+        self.path = path
+        self.title = title
+        self.artist = artist
+        self.duration = duration
+        self.lyrics = lyrics
+        self.cover_hash = cover_hash
+
+
+class LibraryStore:
+    """
+    Локальная библиотека в SQLite: порядок плейлиста, состояние плеера
+    и кэш разобранных тегов, привязанный к (path, size, mtime).
+    Все изменения пишутся точечно, без перезаписи всего плейлиста.
+
+    Позиции в плейлисте идут с шагом POS_GAP, чтобы перенос треков менял
+    только их собственные строки; когда промежуток кончается, позиции
+    перенумеровываются.
+    """
+    POS_GAP = 1024
+
+    def __init__(self, db_path, check_same_thread=True):
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # --- плейлист ---
+
+    def load_playlist(self):
+        rows = self.conn.execute('SELECT path FROM playlist ORDER BY pos')
+        return [row[0] for row in rows]
+
+    def append_tracks(self, paths):
+        with self.conn:
+            self._append(paths)
+
+    def remove_tracks(self, paths):
+        with self.conn:
+            self._remove(paths)
+
+    def move_tracks(self, paths, before=None):
+        """Переносит треки подряд перед треком before (в конец, если None)."""
+        with self.conn:
+            self._move(paths, before)
+
+    def rename_tracks(self, renames):
+        """
+        Файлы переехали: renames — пары (старый путь, новый путь). Строки
+        плейлиста остаются на своих местах, разобранные теги переходят к новому
+        пути (размер и время изменения при переименовании не меняются).
+        """
+        with self.conn:
+            self._rename(renames)
+
+    def apply(self, ops):
+        """
+        Применяет операции журнала одной транзакцией:
+        ('add', paths), ('remove', paths), ('move', paths, before), ('rename', renames),
+        ('state', key, value).
+        """
+        with self.conn:
+            for op, *args in ops:
+                if op == 'add':
+                    self._append(*args)
+                elif op == 'remove':
+                    self._remove(*args)
+                elif op == 'move':
+                    self._move(*args)
+                elif op == 'rename':
+                    self._rename(*args)
+                elif op == 'state':
+                    self._set_state(*args)
+                else:
+                    raise ValueError(f"Неизвестная операция журнала: {op}")
+
+    def compact(self):
+        """Переносит накопленный WAL в основной файл базы и обрезает его."""
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _append(self, paths):
+        last = self.conn.execute('SELECT MAX(pos) FROM playlist').fetchone()[0] or 0
+        self.conn.executemany('INSERT INTO playlist (pos, path) VALUES (?, ?)',
+                              ((last + i * self.POS_GAP, p) for i, p in enumerate(paths, 1)))
+
+    def _remove(self, paths):
+        self.conn.executemany('DELETE FROM playlist WHERE path = ?', ((p,) for p in paths))
+
+    def _move(self, paths, before):
+        paths = [p for p in paths if p != before]
+        if not paths:
+            return
+        self._remove(paths)
+        if before is None:
+            self._append(paths)
+            return
+        row = self.conn.execute('SELECT pos FROM playlist WHERE path = ?', (before,)).fetchone()
+        if row is None:
+            self._append(paths)
+            return
+        high = row[0]
+        low = self.conn.execute('SELECT MAX(pos) FROM playlist WHERE pos < ?',
+                                (high,)).fetchone()[0] or 0
+        step = (high - low) // (len(paths) + 1)
+        if step == 0:
+            # Места между соседями не осталось: перенумеровываем весь плейлист
+            order = self.load_playlist()
+            i = order.index(before)
+            self._rewrite(order[:i] + paths + order[i:])
+            return
+        self.conn.executemany('INSERT INTO playlist (pos, path) VALUES (?, ?)',
+                              ((low + i * step, p) for i, p in enumerate(paths, 1)))
+
+    def _rename(self, renames):
+        self.conn.executemany('UPDATE playlist SET path = ? WHERE path = ?',
+                              ((new, old) for old, new in renames))
+        self.conn.executemany('UPDATE OR REPLACE tracks SET path = ? WHERE path = ?',
+                              ((new, old) for old, new in renames))
+
+    def _rewrite(self, paths):
+        self.conn.execute('DELETE FROM playlist')
+        self.conn.executemany('INSERT INTO playlist (pos, path) VALUES (?, ?)',
+                              ((i * self.POS_GAP, p) for i, p in enumerate(paths, 1)))
+
+    def import_playlist_json(self, json_path):
+        """
+        Переносит старый playlist.json в базу, если плейлист в базе ещё пуст.
+        Возвращает True, если что-то было импортировано.
+        """
+        if not os.path.exists(json_path):
+            return False
+        if self.conn.execute('SELECT 1 FROM playlist LIMIT 1').fetchone():
+            return False
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось импортировать {json_path}: {e}")
+            return False
+
+        self.append_tracks(data.get("playlist", []))
+        self.set_state("current_index", data.get("current_index", -1))
+        return True
+
+    def known_paths(self, paths):
+        """Какие из путей уже есть в кэше метаданных (в любой версии)."""
+        known = set()
+        paths = list(paths)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.conn.execute(
+                'SELECT path FROM tracks WHERE path IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            known.update(row[0] for row in rows)
+        return known
+
+    def versions(self, paths):
+        """{path: (size, mtime)} для путей, которые уже есть в кэше метаданных."""
+        versions = {}
+        paths = list(paths)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.conn.execute(
+                'SELECT path, size, mtime FROM tracks WHERE path IN (%s)' % ','.join('?' * len(chunk)),
+                chunk)
+            versions.update((path, (size, mtime)) for path, size, mtime in rows)
+        return versions
+
+    def records(self, paths):
+        """
+        {path: (TrackRecord, (size, mtime))} для путей из кэша метаданных.
+        Файлы не проверяются: это делает фоновый разбор, которому передаётся версия.
+        """
+        records = {}
+        paths = list(paths)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.conn.execute(
+                'SELECT path, size, mtime, title, artist, duration, lyrics, cover_hash FROM tracks '
+                'WHERE path IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            for path, size, mtime, *fields in rows:
+                records[path] = (TrackRecord(path, *fields), (size, mtime))
+        return records
+
+    def load_tags(self):
+        """
+        Название и исполнитель из кэша для всех треков плейлиста.
+        Актуальность файлов не проверяется: это подсказка для поиска.
+        """
+        rows = self.conn.execute(
+            'SELECT p.path, t.title, t.artist FROM playlist p JOIN tracks t ON t.path = p.path')
+        return {path: (title, artist) for path, title, artist in rows}
+
+    # --- состояние ---
+
+    def get_state(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set_state(self, key, value):
+        with self.conn:
+            self._set_state(key, value)
+
+    def _set_state(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                          (key, json.dumps(value)))
+
+    # --- кэш метаданных ---
+
+    def lookup(self, path, stat=None):
+        """
+        Возвращает TrackRecord, если файл не менялся с момента разбора, иначе None.
+        """
+        if stat is None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+        row = self.conn.execute(
+            'SELECT title, artist, duration, lyrics, cover_hash FROM tracks '
+            'WHERE path = ? AND size = ? AND mtime = ?',
+            (path, stat.st_size, stat.st_mtime)).fetchone()
+        if row is None:
+            return None
+        return TrackRecord(path, *row)
+
+    def store(self, path, stat, title, artist, duration, lyrics, cover_hash):
+        self.store_many([(path, stat, title, artist, duration, lyrics, cover_hash)])
+
+    def store_many(self, records):
+        """Записывает пачку разобранных треков одной транзакцией."""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO tracks '
+                '(path, size, mtime, title, artist, duration, lyrics, cover_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((path, stat.st_size, stat.st_mtime, title, artist, duration, lyrics, cover_id)
+                 for path, stat, title, artist, duration, lyrics, cover_id in records))
+
+
+class PlaylistJournal:
+    """
+    Журнал изменений плейлиста и состояния плеера.
+
+    Операции копятся в памяти и по таймеру пишутся в базу одной транзакцией
+    через отдельное соединение, так что запись можно делать из фонового потока.
+    Стоимость записи зависит от числа изменений, а не от длины плейлиста;
+    после аварийного выхода теряются только изменения последних секунд.
+    Каждые COMPACT_EVERY операций журнал WAL сливается с основной базой.
+    """
+    COMPACT_EVERY = 5000
+
+    def __init__(self, db_path):
+        self._store = LibraryStore(db_path, check_same_thread=False)
+        self._lock = threading.Lock()        # защищает очередь операций
+        self._write_lock = threading.Lock()  # одна запись в базу за раз
+        self._ops = []
+        self._state = {}
+        self._written = 0
+
+    def add(self, paths):
+        self._record(('add', list(paths)))
+
+    def remove(self, paths):
+        self._record(('remove', list(paths)))
+
+    def move(self, paths, before=None):
+        self._record(('move', list(paths), before))
+
+    def rename(self, renames):
+        self._record(('rename', list(renames)))
+
+    def set_state(self, key, value):
+        """Запоминает значение; повтор того же значения в журнал не попадает."""
+        if key in self._state and self._state[key] == value:
+            return
+        self._state[key] = value
+        self._record(('state', key, value))
+
+    def pending(self):
+        return bool(self._ops)
+
+    def flush(self):
+        """Записывает накопленные операции; можно вызывать из любого потока."""
+        with self._write_lock:
+            with self._lock:
+                ops, self._ops = self._ops, []
+            if not ops:
+                return
+            try:
+                self._store.apply(ops)
+            except sqlite3.Error as e:
+                print(f"Не удалось сохранить плейлист: {e}")
+                # Вернём операции в начало очереди и попробуем при следующей записи
+                with self._lock:
+                    self._ops[:0] = ops
+                return
+            self._written += len(ops)
+            if self._written >= self.COMPACT_EVERY:
+                self._compact()
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            self._compact()
+            self._store.close()
+
+    def _record(self, op):
+        with self._lock:
+            self._ops.append(op)
+
+    def _compact(self):
+        try:
+            self._store.compact()
+        except sqlite3.Error as e:
+            print(f"Не удалось сжать журнал базы: {e}")
+        self._written = 0
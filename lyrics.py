@@ -0,0 +1,87 @@
+import os
+import re
+import bisect
+
+
+_TIME_RE = re.compile(r'\[(\d+):(\d{1,2}(?:[.:]\d{1,3})?)\]')
+_OFFSET_RE = re.compile(r'^\[offset:\s*([+-]?\d+)\]', re.IGNORECASE | re.MULTILINE)
+
+
+class SyncedLyrics:
+    """
+    Текст с метками времени: строки отсортированы по времени один раз,
+    активная строка для позиции находится двоичным поиском.
+    """
+    __slots__ = ('times', 'lines')
+
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.times = [time_ms for time_ms, _ in entries]
+        self.lines = [text for _, text in entries]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def line_at(self, position_ms):
+        """Номер строки, которая звучит в позиции position_ms, или -1 до первой строки."""
+        return bisect.bisect_right(self.times, position_ms) - 1
+
+
+def is_synced(text):
+    """Есть ли в тексте метки времени LRC."""
+    return bool(text) and _TIME_RE.search(text) is not None
+
+
+def parse_lrc(text):
+    """
+    Разбирает текст в формате LRC. Возвращает SyncedLyrics или None,
+    если меток времени нет и текст обычный.
+    """
+    if not text or '[' not in text:
+        return None
+    offset = _OFFSET_RE.search(text)
+    # Положительный offset значит, что строки должны появляться раньше
+    shift = int(offset.group(1)) if offset else 0
+
+    entries = []
+    for line in text.splitlines():
+        pos = 0
+        stamps = []
+        while True:
+            match = _TIME_RE.match(line, pos)
+            if match is None:
+                break
+            minutes, seconds = match.groups()
+            seconds = float(seconds.replace(':', '.'))
+            stamps.append(int((int(minutes) * 60 + seconds) * 1000))
+            pos = match.end()
+        line_text = line[pos:].strip()
+        for stamp in stamps:
+            entries.append((max(0, stamp - shift), line_text))
+    return SyncedLyrics(entries) if entries else None
+
+
+def to_lrc(entries):
+    """Собирает LRC из пар (текст, время в мс), например из кадра ID3 SYLT."""
+    lines = []
+    for text, time_ms in entries:
+        minutes, ms = divmod(int(time_ms), 60000)
+        lines.append(f'[{minutes:02d}:{ms / 1000:05.2f}]{text.strip()}')
+    return '\n'.join(lines)
+
+
+def read_sidecar(audio_path):
+    """Текст из файла .lrc рядом с треком, или None."""
+    lrc_path = os.path.splitext(audio_path)[0] + '.lrc'
+    try:
+        with open(lrc_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def choose_lyrics(embedded, sidecar):
+    """Синхронный текст из файла .lrc важнее встроенного текста без меток времени."""
+    if sidecar and not is_synced(embedded) and (not embedded or is_synced(sidecar)):
+        return sidecar
+    return embedded
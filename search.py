@@ -0,0 +1,165 @@
+import re
+import bisect
+
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Разбивает строку на слова в нижнем регистре."""
+    return _TOKEN_RE.findall(text.casefold())
+
+
+class SearchIndex:
+    """
+    Индекс для поиска по плейлисту: каждое слово запроса должно быть началом
+    какого-нибудь слова в имени файла, названии или исполнителе.
+
+    Слова хранятся в отсортированном словаре, поэтому все слова с нужным
+    префиксом находятся двоичным поиском. Если новый запрос уточняет предыдущий,
+    перепроверяются только прошлые результаты.
+    """
+
+    def __init__(self):
+        self._tokens = {}      # ключ трека -> кортеж его слов
+        self._postings = {}    # слово -> множество ключей
+        self._vocabulary = []  # отсортированные слова
+        self._last_query = None
+        self._last_result = None
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def add(self, key, *fields):
+        """
+        Добавляет трек или обновляет его поля. Возвращает True, если трек
+        от этого вошёл в результаты прошлого запроса или выпал из них.
+        """
+        was_found = self._last_result is not None and key in self._last_result
+        if key in self._tokens:
+            self.remove(key)
+
+        tokens = self._tokens[key] = self._field_tokens(fields)
+        for token in tokens:
+            keys = self._postings.get(token)
+            if keys is None:
+                keys = self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            keys.add(key)
+
+        if self._last_result is None:
+            return False
+        if self._matches(tokens, self._last_query):
+            self._last_result.add(key)
+        return was_found != (key in self._last_result)
+
+    def add_many(self, items):
+        """
+        Добавляет пачку треков: items — кортежи (key, *fields).
+        Словарь сортируется один раз, а не вставкой на каждое новое слово.
+        """
+        new_words = []
+        for key, *fields in items:
+            if key in self._tokens:
+                self.remove(key)
+            tokens = self._tokens[key] = self._field_tokens(fields)
+            for token in tokens:
+                keys = self._postings.get(token)
+                if keys is None:
+                    keys = self._postings[token] = set()
+                    new_words.append(token)
+                keys.add(key)
+
+        if new_words:
+            self._vocabulary.extend(new_words)
+            self._vocabulary.sort()
+        self._last_query = self._last_result = None
+
+    def remove(self, key):
+        tokens = self._tokens.pop(key, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            keys = self._postings[token]
+            keys.discard(key)
+            if not keys:
+                del self._postings[token]
+                pos = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[pos]
+        if self._last_result is not None:
+            self._last_result.discard(key)
+
+    def remove_many(self, keys):
+        """
+        Убирает пачку треков. Опустевшие слова вычищаются из словаря
+        одним проходом, а не удалением из середины списка на каждое.
+        Возвращает True, если какие-то треки выпали из результатов прошлого запроса.
+        """
+        found = False
+        dropped = set()
+        for key in keys:
+            tokens = self._tokens.pop(key, None)
+            if tokens is None:
+                continue
+            for token in tokens:
+                postings = self._postings[token]
+                postings.discard(key)
+                if not postings:
+                    del self._postings[token]
+                    dropped.add(token)
+            if self._last_result is not None and key in self._last_result:
+                self._last_result.discard(key)
+                found = True
+
+        if dropped:
+            self._vocabulary = [word for word in self._vocabulary if word not in dropped]
+        return found
+
+    def search(self, query):
+        """
+        Возвращает множество ключей, подходящих под запрос,
+        или None, если запрос пустой и показывать нужно всё.
+        Множество — копия: индекс дальше меняет только свои результаты,
+        поэтому после add и remove запрос нужно повторить.
+        """
+        words = tuple(tokenize(query))
+        if not words:
+            self._last_query = self._last_result = None
+            return None
+        if words == self._last_query:
+            # add и remove держат прежние результаты в актуальном виде
+            return set(self._last_result)
+
+        if self._last_query is not None and self._refines(words, self._last_query):
+            candidates = self._last_result
+        else:
+            # Самое длинное слово обычно самое избирательное
+            candidates = self._prefix_keys(max(words, key=len))
+
+        result = {key for key in candidates if self._matches(self._tokens[key], words)}
+        self._last_query = words
+        self._last_result = result
+        return set(result)
+
+    def _prefix_keys(self, prefix):
+        keys = set()
+        pos = bisect.bisect_left(self._vocabulary, prefix)
+        vocabulary = self._vocabulary
+        while pos < len(vocabulary) and vocabulary[pos].startswith(prefix):
+            keys |= self._postings[vocabulary[pos]]
+            pos += 1
+        return keys
+
+    @staticmethod
+    def _field_tokens(fields):
+        return tuple(set(tokenize(' '.join(f for f in fields if f))))
+
+    @staticmethod
+    def _matches(tokens, words):
+        return all(any(t.startswith(w) for t in tokens) for w in words)
+
+    @staticmethod
+    def _refines(words, previous):
+        # Каждое прежнее слово должно остаться началом какого-то нового,
+        # тогда новые результаты — подмножество старых
+        return all(any(w.startswith(p) for w in words) for p in previous)
@@ -0,0 +1,138 @@
+import random
+from collections import deque
+
+
+class ShuffleQueue:
+    """
+    Порядок случайного воспроизведения.
+
+    Следующий трек вытягивается из ещё не сыгранных в этом круге (ленивый
+    Фишер — Йейтс: случайный элемент меняется местами с последним и снимается),
+    поэтому трек не повторится, пока не прозвучат все остальные. Добавление
+    и удаление треков стоят O(1) и не требуют перетасовки. Следующий трек
+    известен заранее (peek), а назад можно вернуться по истории.
+    """
+    HISTORY_SIZE = 500
+
+    def __init__(self, keys=(), rng=None):
+        self._random = rng or random.Random()
+        self._members = set()
+        self._pool = []        # ещё не сыгранные в этом круге
+        self._positions = {}   # ключ -> позиция в _pool
+        self._back = deque(maxlen=self.HISTORY_SIZE)  # сыгранные до текущего
+        self._forward = []     # треки, от которых ушли кнопкой «назад»
+        self._upcoming = None
+        self.current = None
+        self.add(keys)
+
+    def __len__(self):
+        return len(self._members)
+
+    def reset(self, keys=(), current=None):
+        """Начинает новый круг с новым набором треков."""
+        self._members.clear()
+        self._pool.clear()
+        self._positions.clear()
+        self._back.clear()
+        self._forward.clear()
+        self._upcoming = None
+        self.current = None
+        self.add(keys)
+        if current is not None:
+            self.played(current)
+
+    def add(self, keys):
+        for key in keys:
+            if key not in self._members:
+                self._members.add(key)
+                self._pool_add(key)
+
+    def remove(self, keys):
+        removed = {key for key in keys if key in self._members}
+        if not removed:
+            return
+        self._members -= removed
+        for key in removed:
+            self._pool_discard(key)
+        if any(key in removed for key in self._back):
+            self._back = deque((k for k in self._back if k not in removed),
+                               maxlen=self.HISTORY_SIZE)
+        self._forward = [key for key in self._forward if key not in removed]
+        if self._upcoming in removed:
+            self._upcoming = None
+        if self.current in removed:
+            self.current = None
+
+    def peek(self):
+        """Трек, который пойдёт следующим; повторные вызовы возвращают тот же."""
+        if self._forward:
+            return self._forward[-1]
+        if self._upcoming is None:
+            if not self._pool:
+                # Круг закончился: в новый входят все, кроме текущего
+                for key in self._members:
+                    if key != self.current:
+                        self._pool_add(key)
+            if self._pool:
+                self._upcoming = self._draw()
+            elif self.current in self._members:
+                # Единственный трек повторяется
+                return self.current
+        return self._upcoming
+
+    def advance(self):
+        """Переходит к следующему треку и возвращает его (None, если треков нет)."""
+        key = self.peek()
+        if key is None:
+            return None
+        if self._forward:
+            self._forward.pop()
+        else:
+            self._upcoming = None
+        self._push_current(key)
+        return key
+
+    def back(self):
+        """Возвращается к предыдущему треку; None, если история пуста."""
+        if not self._back:
+            return None
+        if self.current is not None:
+            self._forward.append(self.current)
+        self.current = self._back.pop()
+        self._pool_discard(self.current)
+        return self.current
+
+    def played(self, key):
+        """Отмечает трек, выбранный не через advance/back (например, двойным щелчком)."""
+        if key == self.current or key not in self._members:
+            return
+        self._forward.clear()
+        if key == self._upcoming:
+            self._upcoming = None
+        self._push_current(key)
+
+    def _push_current(self, key):
+        self._pool_discard(key)
+        if self.current is not None:
+            self._back.append(self.current)
+        self.current = key
+
+    def _draw(self):
+        pool = self._pool
+        i = self._random.randrange(len(pool))
+        key = pool[i]
+        self._pool_discard(key)
+        return key
+
+    def _pool_add(self, key):
+        self._positions[key] = len(self._pool)
+        self._pool.append(key)
+
+    def _pool_discard(self, key):
+        pos = self._positions.pop(key, None)
+        if pos is None:
+            return
+        last = self._pool.pop()
+        if pos < len(self._pool):
+            self._pool[pos] = last
+            self._positions[last] = pos
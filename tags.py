@@ -0,0 +1,192 @@
+import os
+import importlib
+
+from library import cover_hash
+from lyrics import to_lrc
+
+
+class TrackInfo:
+    """
+    Теги трека, прочитанные за один разбор файла.
+
+    cover — байты обложки или None; cover_hash — хэш обложки, None, если
+    обложки нет, и пустая строка, если она есть, но не читалась (with_cover=False).
+    sidecar — текст из файла .lrc рядом с треком; read_tags его не читает,
+    поле заполняет тот, кому текст нужен для показа.
+    """
+    __slots__ = ('title', 'artist', 'album', 'duration', 'lyrics', 'cover', 'cover_hash',
+                 'sidecar')
+
+    def __init__(self, title=None, artist=None, album=None, duration=None, lyrics=None,
+                 cover=None, cover_hash=None, sidecar=None):
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.duration = duration
+        self.lyrics = lyrics
+        self.cover = cover
+        self.cover_hash = cover_hash
+        self.sidecar = sidecar
+
+
+# Расширение -> (модуль mutagen, класс файла, функция чтения тегов).
+# Модуль импортируется при первом файле с таким расширением.
+_READERS = {}
+_loaded_formats = {}
+
+
+def register_reader(module_name, class_name, *extensions):
+    """
+    Регистрирует функцию reader(audio, info, with_cover) для расширений.
+    Она заполняет TrackInfo из уже открытого файла mutagen; длительность
+    заполняется общим кодом.
+    """
+    def decorator(reader):
+        for ext in extensions:
+            _READERS[ext] = (module_name, class_name, reader)
+        return reader
+    return decorator
+
+
+def _format_class(ext):
+    cls = _loaded_formats.get(ext)
+    if cls is None:
+        module_name, class_name, _ = _READERS[ext]
+        cls = _loaded_formats[ext] = getattr(importlib.import_module(module_name), class_name)
+    return cls
+
+
+def read_tags(file_path, with_cover=True):
+    """
+    Читает теги за одно открытие файла и возвращает TrackInfo.
+    Без with_cover обложка не копируется и не хэшируется — достаточно для списков.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    info = TrackInfo()
+    entry = _READERS.get(ext)
+    if entry is not None:
+        try:
+            audio = _format_class(ext)(file_path)
+            entry[2](audio, info, with_cover)
+            if audio.info is not None:
+                info.duration = audio.info.length
+        except Exception as e:
+            print(f"Ошибка чтения метаданных из {file_path}: {e}")
+
+    if isinstance(info.lyrics, list):
+        info.lyrics = '\n'.join(str(line) for line in info.lyrics)
+    if info.lyrics is not None:
+        info.lyrics = str(info.lyrics)
+    info.title = str(info.title) if info.title else os.path.basename(file_path)
+    info.artist = str(info.artist or "")
+    if info.album is not None:
+        info.album = str(info.album)
+    if info.cover is not None:
+        info.cover_hash = cover_hash(info.cover)
+    return info
+
+
+def _first(values):
+    return values[0] if values else None
+
+
+def _set_cover(info, data, with_cover):
+    if data:
+        info.cover_hash = ''
+        if with_cover:
+            info.cover = bytes(data)
+
+
+@register_reader('mutagen.mp3', 'MP3', '.mp3')
+@register_reader('mutagen.wave', 'WAVE', '.wav')
+def _read_id3(audio, info, with_cover):
+    tags = audio.tags
+    if not tags:
+        return
+    for key, field in (('TIT2', 'title'), ('TPE1', 'artist'), ('TALB', 'album')):
+        frame = tags.get(key)
+        if frame is not None and frame.text:
+            setattr(info, field, frame.text[0])
+
+    # Синхронный текст (время в миллисекундах) важнее обычного
+    synced = [frame for frame in tags.getall('SYLT') if frame.format == 2]
+    lyrics = tags.getall('USLT')
+    if synced:
+        info.lyrics = to_lrc(synced[0].text)
+    elif lyrics:
+        info.lyrics = lyrics[0].text
+    else:
+        for frame in tags.getall('TXXX'):
+            if frame.desc.upper() == 'LYRICS' and frame.text:
+                info.lyrics = frame.text[0]
+                break
+
+    pictures = tags.getall('APIC')
+    if pictures:
+        _set_cover(info, pictures[0].data, with_cover)
+
+
+def _read_vorbis_comments(audio, info):
+    info.title = _first(audio.get('title'))
+    info.artist = _first(audio.get('artist'))
+    info.album = _first(audio.get('album'))
+    info.lyrics = _first(audio.get('lyrics'))
+
+
+@register_reader('mutagen.flac', 'FLAC', '.flac')
+def _read_flac(audio, info, with_cover):
+    _read_vorbis_comments(audio, info)
+    if audio.pictures:
+        _set_cover(info, audio.pictures[0].data, with_cover)
+
+
+@register_reader('mutagen.oggvorbis', 'OggVorbis', '.ogg')
+@register_reader('mutagen.oggopus', 'OggOpus', '.opus')
+def _read_ogg(audio, info, with_cover):
+    _read_vorbis_comments(audio, info)
+
+
+@register_reader('mutagen.mp4', 'MP4', '.m4a', '.mp4', '.aac')
+def _read_mp4(audio, info, with_cover):
+    tags = audio.tags
+    if not tags:
+        return
+    info.title = _first(tags.get('\xa9nam'))
+    info.artist = _first(tags.get('\xa9ART'))
+    info.album = _first(tags.get('\xa9alb'))
+    info.lyrics = _first(tags.get('\xa9lyr'))
+    if info.lyrics is None:
+        # Свободные атомы вида ----:com.apple.iTunes:LYRICS
+        for key in tags.keys():
+            if key.startswith('----:') and 'LYRICS' in key.upper():
+                info.lyrics = tags[key][0].decode('utf-8', errors='ignore')
+                break
+    _set_cover(info, _first(tags.get('covr')), with_cover)
+
+
+@register_reader('mutagen.asf', 'ASF', '.wma', '.asf')
+def _read_asf(audio, info, with_cover):
+    tags = audio.tags
+    if not tags:
+        return
+    info.title = _first(tags.get('Title'))
+    info.artist = _first(tags.get('Author'))
+    info.album = _first(tags.get('WM/AlbumTitle'))
+    info.lyrics = _first(tags.get('WM/Lyrics'))
+    picture = _first(tags.get('WM/Picture'))
+    if picture is not None:
+        info.cover_hash = ''
+        if with_cover:
+            info.cover = _asf_picture_data(picture.value)
+            if not info.cover:
+                info.cover = info.cover_hash = None
+
+
+def _asf_picture_data(value):
+    # WM/Picture: тип (1 байт), размер (4), MIME и описание в UTF-16 с нулём, затем картинка
+    pos = 5
+    for _ in range(2):
+        while pos + 1 < len(value) and value[pos:pos + 2] != b'\x00\x00':
+            pos += 2
+        pos += 2
+    return value[pos:] or None
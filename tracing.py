@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+
+
+class Histogram:
+    """Распределение задержек по корзинам; границы корзин в миллисекундах."""
+    BOUNDS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+    RECENT = 1000
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        # Последние значения: по ним считаются перцентили
+        self._recent = deque(maxlen=self.RECENT)
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def add(self, value_ms):
+        self.counts[bisect.bisect_left(self.bounds, value_ms)] += 1
+        self._recent.append(value_ms)
+
+    def percentile(self, q):
+        """q-й перцентиль по последним значениям или None, если значений нет."""
+        if not self._recent:
+            return None
+        values = sorted(self._recent)
+        return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+    def rows(self):
+        """Пары (подпись корзины, число значений)."""
+        labels = [f'≤ {bound} мс' for bound in self.bounds] + [f'> {self.bounds[-1]} мс']
+        return list(zip(labels, self.counts))
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_args', '_start')
+
+    def __init__(self, tracer, name, args):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer._record(self._name, self._start, time.perf_counter(), self._args)
+        return False
+
+
+class Tracer:
+    """
+    Необязательные замеры горячих путей: отрезки времени вокруг вызовов,
+    итоги по именам и гистограммы для интервалов, которые начинаются и
+    заканчиваются в разных местах (например, переключение трека).
+
+    Пока замеры выключены, span() возвращает общий пустой контекст, а begin()
+    и end() сразу выходят, поэтому расставленные в коде замеры почти ничего
+    не стоят. Отрезки можно записывать из любого потока; последние MAX_EVENTS
+    из них сохраняются в трассу формата Chrome (chrome://tracing, Perfetto).
+    """
+    MAX_EVENTS = 20000
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._events = deque(maxlen=self.MAX_EVENTS)  # (имя, начало, длительность, поток, аргументы)
+        self._totals = {}     # имя -> [число, сумма, максимум] в секундах
+        self._intervals = {}  # имя -> (начало, аргументы)
+        self._histograms = {}
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self._intervals.clear()
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._totals.clear()
+            self._intervals.clear()
+            self._histograms.clear()
+
+    def span(self, name, **args):
+        """Контекст, время которого записывается под именем name."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def begin(self, name, **args):
+        """Начинает интервал; новый begin с тем же именем отменяет незаконченный."""
+        if self.enabled:
+            self._intervals[name] = (time.perf_counter(), args)
+
+    def end(self, name):
+        """Заканчивает интервал: он попадает в трассу и в гистограмму своего имени."""
+        if not self.enabled:
+            return
+        interval = self._intervals.pop(name, None)
+        if interval is None:
+            return
+        start, args = interval
+        end = time.perf_counter()
+        self._record(name, start, end, args)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add((end - start) * 1000)
+
+    def histogram(self, name):
+        return self._histograms.get(name)
+
+    def summary(self):
+        """Список (имя, число, сумма мс, среднее мс, максимум мс), самые долгие сначала."""
+        with self._lock:
+            totals = [(name, count, total, peak) for name, (count, total, peak) in self._totals.items()]
+        rows = [(name, count, total * 1000, total * 1000 / count, peak * 1000)
+                for name, count, total, peak in totals]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def export_chrome_trace(self, file_path):
+        """Записывает отрезки в JSON формата Chrome Trace Event."""
+        pid = os.getpid()
+        main_thread = threading.main_thread().ident
+        with self._lock:
+            events = list(self._events)
+        trace = []
+        threads = set()
+        for name, start, duration, thread, args in events:
+            event = {'name': name, 'ph': 'X', 'pid': pid, 'tid': thread,
+                     'ts': round((start - self._origin) * 1e6, 1),
+                     'dur': round(duration * 1e6, 1)}
+            if args:
+                event['args'] = args
+            trace.append(event)
+            threads.add(thread)
+        for number, thread in enumerate(sorted(threads)):
+            label = 'GUI' if thread == main_thread else f'worker {number}'
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+                          'args': {'name': label}})
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+    def _record(self, name, start, end, args):
+        duration = end - start
+        with self._lock:
+            self._events.append((name, start, duration, threading.get_ident(), args))
+            totals = self._totals.get(name)
+            if totals is None:
+                self._totals[name] = [1, duration, duration]
+            else:
+                totals[0] += 1
+                totals[1] += duration
+                if duration > totals[2]:
+                    totals[2] = duration
@@ -0,0 +1,162 @@
+import os
+from array import array
+
+
+# Кроме '/', путь может делиться системным разделителем (обратная косая в Windows)
+_OTHER_SEP = os.sep if os.sep != '/' else None
+
+
+def _split(path):
+    # Граница сразу после последнего разделителя: каталог и имя вместе дают исходную строку
+    cut = path.rfind('/') + 1
+    if _OTHER_SEP:
+        cut = max(cut, path.rfind(_OTHER_SEP) + 1)
+    return path[:cut], path[cut:]
+
+
+class TrackStore:
+    """
+    Треки, встретившиеся за сеанс. Путь раскладывается на каталог и имя файла,
+    и каждый каталог хранится один раз на все свои треки. Трек получает номер
+    (id), который не меняется до конца работы программы: плейлист, индексы
+    и кэши ссылаются на треки номерами, а полный путь собирается только там,
+    где он нужен, — для воспроизведения, разбора тегов и записи в библиотеку.
+
+    Здесь же лежат столбцы с уже известными тегами (название, исполнитель,
+    длительность); одинаковые имена исполнителей хранятся одной строкой.
+    Треки не удаляются: номер убранного из плейлиста трека может ещё прийти
+    из фонового разбора.
+    """
+
+    def __init__(self):
+        self._dirs = []             # номер каталога -> каталог с разделителем на конце
+        self._dir_ids = {}          # каталог -> номер
+        self._dir_tracks = []       # номер каталога -> {имя файла: id}
+        self._dir_of = array('I')   # id -> номер каталога
+        self._names = []            # id -> имя файла
+        self._titles = []
+        self._artists = []
+        self._durations = array('d')
+        self._known = bytearray()   # 1, если теги трека известны
+        self._artist_names = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, path):
+        """Номер трека; путь, который ещё не встречался, получает новый номер."""
+        folder, name = _split(path)
+        dir_id = self._dir_ids.get(folder)
+        if dir_id is None:
+            dir_id = self._add_dir(folder)
+        tracks = self._dir_tracks[dir_id]
+        track_id = tracks.get(name)
+        if track_id is None:
+            track_id = tracks[name] = len(self._names)
+            self._dir_of.append(dir_id)
+            self._names.append(name)
+            self._grow(1)
+        return track_id
+
+    def add_many(self, paths):
+        """
+        Номера треков списком. В нём те же объекты чисел, что лежат в словарях
+        хранилища, поэтому плейлист и построенные по нему индексы (перемешивание,
+        поиск) не заводят на каждый трек собственную копию числа.
+        """
+        dir_ids = self._dir_ids
+        dir_tracks = self._dir_tracks
+        dir_of = self._dir_of
+        names = self._names
+        added = len(names)
+        ids = []
+        # Треки одного каталога обычно идут подряд: каталог ищется один раз на серию
+        last_folder = tracks = dir_id = None
+        for path in paths:
+            # То же, что _split, без вызова функции на каждый путь
+            cut = path.rfind('/') + 1
+            if _OTHER_SEP:
+                cut = max(cut, path.rfind(_OTHER_SEP) + 1)
+            folder = path[:cut]
+            name = path[cut:]
+            if folder != last_folder:
+                dir_id = dir_ids.get(folder)
+                if dir_id is None:
+                    dir_id = self._add_dir(folder)
+                tracks = dir_tracks[dir_id]
+                last_folder = folder
+            track_id = tracks.get(name)
+            if track_id is None:
+                track_id = tracks[name] = len(names)
+                dir_of.append(dir_id)
+                names.append(name)
+            ids.append(track_id)
+        self._grow(len(names) - added)
+        return ids
+
+    def find(self, path):
+        """Номер трека или None, если такой путь не встречался."""
+        folder, name = _split(path)
+        dir_id = self._dir_ids.get(folder)
+        if dir_id is None:
+            return None
+        return self._dir_tracks[dir_id].get(name)
+
+    def _add_dir(self, folder):
+        dir_id = self._dir_ids[folder] = len(self._dirs)
+        self._dirs.append(folder)
+        self._dir_tracks.append({})
+        return dir_id
+
+    def _grow(self, count):
+        """Дописывает столбцы тегов для count новых треков."""
+        if count:
+            self._titles.extend([None] * count)
+            self._artists.extend([None] * count)
+            self._durations.extend(array('d', bytes(8 * count)))
+            self._known.extend(bytes(count))
+
+    def folder_tracks(self, folder, recursive=False):
+        """
+        Номера встречавшихся треков каталога folder (путь без разделителя
+        на конце); с recursive=True — и треков всех его подкаталогов.
+        """
+        prefix = os.path.join(folder, '')
+        if not recursive:
+            dir_id = self._dir_ids.get(prefix)
+            return [] if dir_id is None else list(self._dir_tracks[dir_id].values())
+        return [track_id
+                for dir_id, name in enumerate(self._dirs) if name.startswith(prefix)
+                for track_id in self._dir_tracks[dir_id].values()]
+
+    def path(self, track_id):
+        return self._dirs[self._dir_of[track_id]] + self._names[track_id]
+
+    def paths(self, track_ids):
+        return [self.path(track_id) for track_id in track_ids]
+
+    def name(self, track_id):
+        """Имя файла без каталога."""
+        return self._names[track_id]
+
+    # --- теги ---
+
+    def info(self, track_id):
+        """(title, artist, duration) или None, если теги трека ещё не известны."""
+        if not self._known[track_id]:
+            return None
+        return self._titles[track_id], self._artists[track_id], self._durations[track_id]
+
+    def set_info(self, track_id, title, artist, duration):
+        if artist:
+            artist = self._artist_names.setdefault(artist, artist)
+        self._titles[track_id] = title
+        self._artists[track_id] = artist
+        self._durations[track_id] = duration or 0.0
+        self._known[track_id] = 1
+
+    def forget_info(self, track_id):
+        """Теги трека перечитаются при следующем показе."""
+        self._titles[track_id] = self._artists[track_id] = None
+        self._durations[track_id] = 0.0
+        self._known[track_id] = 0
@@ -0,0 +1,153 @@
+import hashlib
+import importlib.util
+import multiprocessing.context
+import sys
+import wave
+
+# NumPy импортируется при первом разборе (load), а не при запуске плеера
+np = None
+_available = None
+
+
+# Столько пар (минимум, максимум) хранится для трека: хватает на ширину окна
+PEAK_COUNT = 2048
+# Частичные пики при потоковом разборе считаются по блокам такой длины
+BLOCK_SAMPLES = 256
+_CHUNK_FRAMES = 1 << 20
+
+
+def available():
+    """Есть ли NumPy; без него полоса прокрутки остаётся обычной. Сам модуль не импортируется."""
+    global _available
+    if _available is None:
+        _available = np is not None or importlib.util.find_spec('numpy') is not None
+    return _available
+
+
+def load():
+    """Импортирует NumPy; вызывается перед первым разбором в каждом процессе."""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        # spawn передаёт дочернему процессу путь главного модуля, и тот выполняет
+        # его заново, то есть импортирует PyTune.py с PyQt6. Без __file__ дочерний
+        # процесс загружает только модули своей задачи.
+        main = sys.modules['__main__']
+        main_path = main.__dict__.pop('__file__', None)
+        try:
+            return multiprocessing.context.SpawnProcess._Popen(process_obj)
+        finally:
+            if main_path is not None:
+                main.__file__ = main_path
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+def worker_context():
+    """Контекст для пула процессов, считающих пики: spawn без главного модуля."""
+    return _WorkerContext()
+
+
+def peaks_key(path, version):
+    """Ключ кэша: путь и версия файла — его размер и время изменения."""
+    size, mtime = version
+    return hashlib.sha1(f'{path}|{size}|{mtime}'.encode()).hexdigest()
+
+
+def load_peaks(file_path):
+    """Отображает файл пиков в память: массив (N, 2) int8 без чтения целиком."""
+    return np.memmap(file_path, dtype=np.int8, mode='r').reshape(-1, 2)
+
+
+def to_int16(data, sample_width):
+    """Сырые байты PCM в int16 (8 бит — беззнаковые, 24 и 32 — старшие байты)."""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if sample_width == 1:
+        return ((raw.astype(np.int16) - 128) << 8)
+    if sample_width == 2:
+        return raw.view('<i2')
+    if sample_width == 3:
+        # Старшие два байта каждого 24-битного отсчёта
+        triples = raw[:len(raw) - len(raw) % 3].reshape(-1, 3)
+        return (triples[:, 1].astype(np.uint16) | (triples[:, 2].astype(np.uint16) << 8)).view(np.int16)
+    if sample_width == 4:
+        return (raw.view('<i4') >> 16).astype(np.int16)
+    raise ValueError(f"Неподдерживаемая разрядность: {sample_width * 8} бит")
+
+
+def float_to_int16(data):
+    """Отсчёты float32 в диапазоне [-1, 1] в int16."""
+    samples = np.frombuffer(data, dtype=np.float32)
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def column_extents(peaks, width):
+    """
+    Сводит пики к width столбцам и нормирует по самому громкому месту трека.
+    Возвращает списки нижних и верхних значений в диапазоне [-1, 1].
+    """
+    edges = np.linspace(0, len(peaks), width + 1).astype(np.int64)[:-1]
+    mins = np.minimum.reduceat(peaks[:, 0], edges).astype(np.float32)
+    maxs = np.maximum.reduceat(peaks[:, 1], edges).astype(np.float32)
+    loudest = max(1, int(np.abs(peaks.astype(np.int16)).max()))
+    return (mins / loudest).tolist(), (maxs / loudest).tolist()
+
+
+def block_peaks(samples, block):
+    """Минимум и максимум каждого блока из block отсчётов (последний может быть короче)."""
+    full = len(samples) - len(samples) % block
+    mins = samples[:full].reshape(-1, block).min(axis=1)
+    maxs = samples[:full].reshape(-1, block).max(axis=1)
+    if full < len(samples):
+        tail = samples[full:]
+        mins = np.append(mins, tail.min())
+        maxs = np.append(maxs, tail.max())
+    return mins, maxs
+
+
+def finish_peaks(mins, maxs, count=PEAK_COUNT):
+    """Сводит частичные пики к count парам и упаковывает их в int8."""
+    if len(mins) == 0:
+        return b''
+    if len(mins) > count:
+        edges = np.linspace(0, len(mins), count + 1).astype(np.int64)[:-1]
+        mins = np.minimum.reduceat(mins, edges)
+        maxs = np.maximum.reduceat(maxs, edges)
+    peaks = np.empty((len(mins), 2), dtype=np.int8)
+    peaks[:, 0] = np.clip(np.asarray(mins, dtype=np.int32) >> 8, -127, 127)
+    peaks[:, 1] = np.clip(np.asarray(maxs, dtype=np.int32) >> 8, -127, 127)
+    return peaks.tobytes()
+
+
+def wav_peaks(path, count=PEAK_COUNT):
+    """
+    Пики WAV-файла, читаемого кусками. Выполняется в отдельном процессе,
+    поэтому принимает и возвращает только простые значения.
+    """
+    load()
+    with wave.open(path, 'rb') as f:
+        channels = f.getnchannels()
+        width = f.getsampwidth()
+        frames = f.getnframes()
+        # Блок кратен куску, чтобы границы блоков не зависели от чтения
+        block = max(1, -(-frames // (count * 4))) * channels
+        chunk = max(block, _CHUNK_FRAMES * channels // block * block)
+        all_mins, all_maxs = [], []
+        while True:
+            data = f.readframes(chunk // channels)
+            if not data:
+                break
+            mins, maxs = block_peaks(to_int16(data, width), block)
+            all_mins.append(mins)
+            all_maxs.append(maxs)
+    if not all_mins:
+        return b''
+    return finish_peaks(np.concatenate(all_mins), np.concatenate(all_maxs), count)